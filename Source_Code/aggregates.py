@@ -0,0 +1,741 @@
+"""
+Aggregates precomputed at load time so that callbacks never scan every trip.
+
+Everything here is keyed by ``pickup_hour`` (0-23): a range filter on the hour
+slider becomes a sum over at most 24 small arrays, or a difference of two
+prefix sums.
+"""
+import numpy as np
+import pandas as pd
+
+from schema import column_values
+from spatial import CELL_COUNT, NO_CELL
+
+
+HOURS = 24
+
+
+def _prefix(values):
+    """
+    Prefix sums with a leading zero, so that ``p[h1 + 1] - p[h0]`` is the
+    total over the inclusive hour range ``[h0, h1]``.
+    """
+    return np.concatenate([np.zeros(1, dtype=values.dtype), np.cumsum(values)])
+
+
+def fixed_point_scale(values, scale=100):
+    """
+    Returns ``scale`` when every finite value is an exact multiple of
+    ``1 / scale`` (cents for money, hundredths of a mile for distance), and 1
+    otherwise. Sums taken in those integer units are exact, so means derived
+    from them do not depend on summation order.
+    """
+    finite = values[np.isfinite(values)]
+    units = np.round(finite * scale)
+    if np.abs(units).sum() < 2 ** 53 and np.array_equal(units / scale, finite):
+        return scale
+    return 1
+
+
+def _group_sum(keys, values, size=HOURS):
+    """
+    Sum and non-null count of a numeric column per integer group key (NaNs
+    skipped, as in ``Series.mean``). Sums are kept in integer units of
+    ``1 / scale`` whenever the data allows it.
+    """
+    values = np.asarray(values, dtype='float64')
+    valid = ~np.isnan(values)
+    keys, values = keys[valid], values[valid]
+    scale = fixed_point_scale(values)
+    if scale == 1:
+        sums = np.bincount(keys, weights=values, minlength=size)
+    else:
+        sums = np.bincount(keys, weights=np.round(values * scale), minlength=size).astype('int64')
+    counts = np.bincount(keys, minlength=size)
+    return sums, counts, scale
+
+
+def _mean(total, count, scale):
+    """
+    ``total / (scale * count)``; for integer totals Python's true division of
+    ints is correctly rounded, i.e. the double nearest the exact mean.
+    """
+    if isinstance(total, np.integer):
+        return int(total) / (scale * int(count))
+    return total / scale / count
+
+
+def _merge_sums(sums_a, scale_a, sums_b, scale_b):
+    """
+    Adds two per-hour sum arrays, falling back to float units when the scales
+    disagree.
+    """
+    if scale_a == scale_b:
+        return sums_a + sums_b, scale_a
+    return sums_a / scale_a + sums_b / scale_b, 1
+
+
+class HourlyRollup:
+    """
+    Trip count, fare sum and distance sum per pickup hour, plus prefix sums.
+    Instances are immutable; ``merge`` returns a new rollup so that appended
+    data can be folded in without rescanning the history.
+    """
+
+    def __init__(self, trips, fare_sum, fare_count, distance_sum, distance_count,
+                 fare_scale=1, distance_scale=1):
+        self.trips = trips
+        self.fare_sum = fare_sum
+        self.fare_count = fare_count
+        self.distance_sum = distance_sum
+        self.distance_count = distance_count
+        self.fare_scale = fare_scale
+        self.distance_scale = distance_scale
+        self._prefix = {
+            name: _prefix(getattr(self, name))
+            for name in ('trips', 'fare_sum', 'fare_count', 'distance_sum', 'distance_count')
+        }
+
+    @classmethod
+    def from_frame(cls, df):
+        hours = df['pickup_hour'].to_numpy(dtype='int64')
+        trips = np.bincount(hours, minlength=HOURS)
+        fare_sum, fare_count, fare_scale = _group_sum(hours, column_values(df, 'fare_amount'))
+        distance_sum, distance_count, distance_scale = _group_sum(hours, column_values(df, 'trip_distance'))
+        return cls(trips, fare_sum, fare_count, distance_sum, distance_count,
+                   fare_scale, distance_scale)
+
+    def merge(self, other):
+        fare_sum, fare_scale = _merge_sums(self.fare_sum, self.fare_scale,
+                                           other.fare_sum, other.fare_scale)
+        distance_sum, distance_scale = _merge_sums(self.distance_sum, self.distance_scale,
+                                                   other.distance_sum, other.distance_scale)
+        return HourlyRollup(
+            self.trips + other.trips,
+            fare_sum,
+            self.fare_count + other.fare_count,
+            distance_sum,
+            self.distance_count + other.distance_count,
+            fare_scale,
+            distance_scale,
+        )
+
+    def _range(self, name, h0, h1):
+        prefix = self._prefix[name]
+        return prefix[h1 + 1] - prefix[h0]
+
+    def range_metrics(self, h0, h1):
+        """
+        Returns ``(total_trips, avg_fare, avg_distance)`` for the inclusive hour
+        range; the averages are None when there is nothing to average.
+        """
+        total_trips = int(self._range('trips', h0, h1))
+        fare_count = self._range('fare_count', h0, h1)
+        distance_count = self._range('distance_count', h0, h1)
+        avg_fare = _mean(self._range('fare_sum', h0, h1), fare_count,
+                         self.fare_scale) if fare_count else None
+        avg_distance = _mean(self._range('distance_sum', h0, h1), distance_count,
+                             self.distance_scale) if distance_count else None
+        return total_trips, avg_fare, avg_distance
+
+
+def equal_width_edges(values, nbins):
+    """
+    ``nbins + 1`` equi-width bin edges spanning the finite values, or None when
+    there are none. A constant column gets a unit-wide range around its value.
+    """
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return None
+    lo, hi = float(finite.min()), float(finite.max())
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    return np.linspace(lo, hi, nbins + 1)
+
+
+def bin_indices(values, edges):
+    """
+    Vectorized bin assignment with ``np.histogram`` semantics (the last bin is
+    closed on the right). Values outside the edges or NaN get -1.
+    """
+    nbins = len(edges) - 1
+    idx = np.searchsorted(edges, values, side='right') - 1
+    idx[values == edges[-1]] = nbins - 1
+    idx[(idx < 0) | (idx >= nbins) | np.isnan(values)] = -1
+    return idx
+
+
+def _extend_bins(edges, counts, lo, hi, nbins):
+    """
+    Equi-width ``edges`` and per-hour ``counts`` widened by whole bins until
+    they cover ``[lo, hi]``; coarsened by an integer factor when they would
+    exceed ``2 * nbins`` bins.
+    """
+    width = edges[1] - edges[0]
+    below = max(int(np.ceil((edges[0] - lo) / width)), 0)
+    above = max(int(np.ceil((hi - edges[-1]) / width)), 0)
+    current = len(edges) - 1
+    if below == 0 and above == 0:
+        return edges, counts
+    factor = 1
+    if below + current + above > 2 * nbins:
+        factor = -(-(below + current + above) // nbins)
+        # Whole groups of ``factor`` bins on either side of the old range.
+        below = -(-below // factor) * factor
+        above = -(-(below + current + above) // factor) * factor - below - current
+    total = below + current + above
+    widened = np.zeros((HOURS, total), dtype=counts.dtype)
+    widened[:, below:below + current] = counts
+    widened = widened.reshape(HOURS, total // factor, factor).sum(axis=2)
+    fine = np.concatenate([edges[0] - width * np.arange(below, 0, -1), edges,
+                           edges[-1] + width * np.arange(1, above + 1)])
+    return fine[::factor], widened
+
+
+class HistogramRollup:
+    """
+    Per-hour bin counts over fixed equi-width edges for each numerical column.
+    The histogram for an hour range is the sum of at most 24 rows of counts.
+    """
+
+    def __init__(self, edges, counts, nbins=30):
+        self.edges = edges
+        self.counts = counts
+        self.nbins = nbins
+
+    @classmethod
+    def from_frame(cls, df, columns, nbins=30, weather=None):
+        hours = df['pickup_hour'].to_numpy(dtype='int64')
+        edges, counts = {}, {}
+        for col in columns:
+            values = np.asarray(column_values(df, col, weather), dtype='float64')
+            col_edges = equal_width_edges(values, nbins)
+            if col_edges is None:
+                continue
+            idx = bin_indices(values, col_edges)
+            keep = idx >= 0
+            flat = np.bincount(hours[keep] * nbins + idx[keep], minlength=HOURS * nbins)
+            edges[col] = col_edges
+            counts[col] = flat.reshape(HOURS, nbins)
+        return cls(edges, counts, nbins)
+
+    def append(self, df, columns, weather=None):
+        """
+        Returns a rollup that also counts the trips of ``df``, without the
+        history: new values are binned on the existing edges, which are first
+        extended by whole bins of the same width to cover them. When that
+        leaves more than ``2 * nbins`` bins, every ``factor`` neighbouring bins
+        are added into one, so the edges stay equi-width, the counts stay
+        exact and the bin count stays bounded.
+        """
+        hours = df['pickup_hour'].to_numpy(dtype='int64')
+        edges, counts = dict(self.edges), dict(self.counts)
+        for col in columns:
+            values = np.asarray(column_values(df, col, weather), dtype='float64')
+            finite = values[np.isfinite(values)]
+            if finite.size == 0:
+                continue
+            if col not in edges:
+                added = HistogramRollup.from_frame(df, [col], self.nbins, weather)
+                edges[col], counts[col] = added.edges[col], added.counts[col]
+                continue
+            col_edges, col_counts = _extend_bins(edges[col], counts[col], finite.min(), finite.max(), self.nbins)
+            idx = bin_indices(values, col_edges)
+            keep = idx >= 0
+            nbins = len(col_edges) - 1
+            col_counts = col_counts + np.bincount(hours[keep] * nbins + idx[keep],
+                                                  minlength=HOURS * nbins).reshape(HOURS, nbins)
+            edges[col], counts[col] = col_edges, col_counts
+        return HistogramRollup(edges, counts, self.nbins)
+
+    def range_histogram(self, column, h0, h1):
+        """
+        Returns ``(edges, counts)`` for the inclusive hour range, trimmed to the
+        bins between the first and last non-empty one. Returns None when the
+        range holds no values of ``column``.
+        """
+        if column not in self.counts:
+            return None
+        counts = self.counts[column][h0:h1 + 1].sum(axis=0)
+        nonzero = np.flatnonzero(counts)
+        if nonzero.size == 0:
+            return None
+        first, last = nonzero[0], nonzero[-1]
+        return self.edges[column][first:last + 2], counts[first:last + 1]
+
+
+class CategoryRollup:
+    """
+    Per-hour value counts for each categorical column.
+    """
+
+    def __init__(self, values, counts):
+        self.values = values
+        self.counts = counts
+
+    @classmethod
+    def from_frame(cls, df, columns):
+        hours = df['pickup_hour'].to_numpy(dtype='int64')
+        values, counts = {}, {}
+        for col in columns:
+            present = df[col].notna().to_numpy()
+            uniques, codes = np.unique(df[col].to_numpy()[present], return_inverse=True)
+            flat = np.bincount(hours[present] * len(uniques) + codes,
+                               minlength=HOURS * len(uniques))
+            values[col] = uniques
+            counts[col] = flat.reshape(HOURS, len(uniques))
+        return cls(values, counts)
+
+    def merge(self, other):
+        """
+        Rollup of both inputs, over the union of their values.
+        """
+        values, counts = {}, {}
+        for col in self.values:
+            merged = np.union1d(self.values[col], other.values[col])
+            total = np.zeros((HOURS, len(merged)), dtype='int64')
+            for part in (self, other):
+                total[:, np.searchsorted(merged, part.values[col])] += part.counts[col]
+            values[col], counts[col] = merged, total
+        return CategoryRollup(values, counts)
+
+    def range_value_counts(self, column, h0, h1):
+        """
+        Returns ``(values, counts)`` for the inclusive hour range, most frequent
+        first like ``Series.value_counts``; values that never occur are dropped.
+        """
+        counts = self.counts[column][h0:h1 + 1].sum(axis=0)
+        order = np.argsort(-counts, kind='stable')
+        order = order[counts[order] > 0]
+        return self.values[column][order], counts[order]
+
+
+class RegressionStats:
+    """
+    Per-hour sufficient statistics for simple linear regression between every
+    pair of numerical columns.
+
+    For columns ``i`` and ``j`` (rows where either is NaN excluded), with
+    hour-indexed arrays of shape ``(24, k, k)``:
+
+    - ``n[h, i, j]``     count of rows
+    - ``s[h, i, j]``     sum of column ``i``
+    - ``q[h, i, j]``     sum of squares of column ``i``
+    - ``p[h, i, j]``     sum of products of columns ``i`` and ``j``
+
+    so for the pair (x=i, y=j) the sums of y and y² are ``s[j, i]`` and
+    ``q[j, i]``. Per-hour min/max of each column bound the trendline.
+    """
+
+    def __init__(self, columns, n, s, q, p, minimum, maximum):
+        self.columns = list(columns)
+        self.n = n
+        self.s = s
+        self.q = q
+        self.p = p
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @classmethod
+    def from_frame(cls, df, columns, weather=None):
+        hours = df['pickup_hour'].to_numpy(dtype='int64')
+        k = len(columns)
+        n, s, q, p = (np.zeros((HOURS, k, k)) for _ in range(4))
+        minimum = np.full((HOURS, k), np.nan)
+        maximum = np.full((HOURS, k), np.nan)
+        order = np.argsort(hours, kind='stable')
+        # Column by column: selecting a column list would consolidate (copy)
+        # the frame's blocks, which breaks a memory-mapped table.
+        values = np.column_stack([column_values(df, col, weather).astype('float64') for col in columns])[order]
+        bounds = np.searchsorted(hours[order], np.arange(HOURS + 1))
+        for hour in range(HOURS):
+            x = values[bounds[hour]:bounds[hour + 1]]
+            if len(x) == 0:
+                continue
+            valid = (~np.isnan(x)).astype('float64')
+            x0 = np.where(valid > 0, x, 0.0)
+            n[hour] = valid.T @ valid
+            s[hour] = x0.T @ valid
+            q[hour] = (x0 * x0).T @ valid
+            p[hour] = x0.T @ x0
+            minimum[hour] = np.nanmin(x, axis=0)
+            maximum[hour] = np.nanmax(x, axis=0)
+        return cls(columns, n, s, q, p, minimum, maximum)
+
+    def merge(self, other):
+        """
+        Statistics of both inputs: the sums add, the bounds widen.
+        """
+        return RegressionStats(self.columns, self.n + other.n, self.s + other.s, self.q + other.q,
+                               self.p + other.p, np.fmin(self.minimum, other.minimum),
+                               np.fmax(self.maximum, other.maximum))
+
+    def range_fit(self, x_col, y_col, h0, h1):
+        """
+        Ordinary least squares fit of ``y_col`` on ``x_col`` over the inclusive
+        hour range. Returns a dict with slope, intercept, r2, n and the x extent,
+        or None when the fit is undefined (fewer than two points or constant x).
+        """
+        i, j = self.columns.index(x_col), self.columns.index(y_col)
+        hours = slice(h0, h1 + 1)
+        n = self.n[hours, i, j].sum()
+        sx, sy = self.s[hours, i, j].sum(), self.s[hours, j, i].sum()
+        sxx, syy = self.q[hours, i, j].sum(), self.q[hours, j, i].sum()
+        sxy = self.p[hours, i, j].sum()
+        if n < 2:
+            return None
+        sxx_c = n * sxx - sx * sx
+        syy_c = n * syy - sy * sy
+        sxy_c = n * sxy - sx * sy
+        if sxx_c <= 0:
+            return None
+        slope = sxy_c / sxx_c
+        intercept = (sy - slope * sx) / n
+        r2 = sxy_c * sxy_c / (sxx_c * syy_c) if syy_c > 0 else 1.0
+        x_min = np.nanmin(self.minimum[hours, i])
+        x_max = np.nanmax(self.maximum[hours, i])
+        return {
+            'slope': slope,
+            'intercept': intercept,
+            'r2': r2,
+            'n': int(n),
+            'x_range': (x_min, x_max),
+        }
+
+
+QUANTILE_RELATIVE_ACCURACY = 0.01
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with relative-error guarantees (DDSketch).
+
+    Values are counted in logarithmic buckets: a positive ``x`` falls in bucket
+    ``ceil(log_gamma(x))`` with ``gamma = (1 + alpha) / (1 - alpha)``, negative
+    values in a mirrored set of buckets and exact zeros in their own count.
+    Any quantile estimate ``v`` then satisfies ``|v - x_q| <= alpha * |x_q|``
+    where ``x_q`` is the exact (lower) quantile, whatever the data size.
+    Merging two sketches adds their bucket counts, so the result is identical
+    to sketching the union of their values.
+
+    Buckets ``offset .. offset + len(positive) - 1`` are stored densely; the
+    fixed-point money and distance columns span a few hundred of them.
+    """
+
+    def __init__(self, alpha, offset, positive, negative, zero_count):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.offset = offset
+        self.positive = positive
+        self.negative = negative
+        self.zero_count = zero_count
+
+    @property
+    def count(self):
+        return int(self.positive.sum() + self.negative.sum() + self.zero_count)
+
+    def merge(self, other):
+        if (self.alpha, self.offset, len(self.positive)) != (other.alpha, other.offset, len(other.positive)):
+            raise ValueError('can only merge sketches with the same accuracy and bucket range')
+        return QuantileSketch(self.alpha, self.offset, self.positive + other.positive,
+                              self.negative + other.negative, self.zero_count + other.zero_count)
+
+    def _bucket_value(self, key):
+        # Midpoint (in relative terms) of the bucket (gamma^(key-1), gamma^key].
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantiles(self, qs):
+        """
+        Estimates of the ``qs`` quantiles (0 <= q <= 1), or None for an empty
+        sketch.
+        """
+        n = self.count
+        if n == 0:
+            return None
+        # Ascending value order: negative buckets by decreasing key, zeros,
+        # positive buckets by increasing key.
+        counts = np.concatenate([self.negative[::-1], [self.zero_count], self.positive])
+        cumulative = np.cumsum(counts)
+        keys = self.offset + np.arange(len(self.positive))
+        values = np.concatenate([-self._bucket_value(keys[::-1]), [0.0], self._bucket_value(keys)])
+        ranks = np.asarray(qs, dtype='float64') * (n - 1)
+        return values[np.searchsorted(cumulative, ranks, side='right')]
+
+
+class QuantileRollup:
+    """
+    One ``QuantileSketch`` per pickup hour for each numerical column, stored as
+    per-hour bucket count rows over a shared bucket range per column. The
+    sketch of an hour range merges at most 24 of them (a sum of count rows).
+    """
+
+    def __init__(self, alpha, offsets, positive, negative, zero_counts):
+        self.alpha = alpha
+        self.offsets = offsets
+        self.positive = positive
+        self.negative = negative
+        self.zero_counts = zero_counts
+
+    @classmethod
+    def from_frame(cls, df, columns, alpha=QUANTILE_RELATIVE_ACCURACY, weather=None):
+        hours = df['pickup_hour'].to_numpy(dtype='int64')
+        log_gamma = np.log((1 + alpha) / (1 - alpha))
+        offsets, positive, negative, zero_counts = {}, {}, {}, {}
+        for col in columns:
+            values = np.asarray(column_values(df, col, weather), dtype='float64')
+            valid = ~np.isnan(values)
+            col_hours, values = hours[valid], values[valid]
+            nonzero = values != 0
+            keys = np.zeros(len(values), dtype='int64')
+            keys[nonzero] = np.ceil(np.log(np.abs(values[nonzero])) / log_gamma).astype('int64')
+            offset = int(keys[nonzero].min()) if nonzero.any() else 0
+            width = int(keys[nonzero].max()) - offset + 1 if nonzero.any() else 1
+            for store, sign in ((positive, values > 0), (negative, values < 0)):
+                flat = np.bincount(col_hours[sign] * width + keys[sign] - offset, minlength=HOURS * width)
+                store[col] = flat.reshape(HOURS, width)
+            offsets[col] = offset
+            zero_counts[col] = np.bincount(col_hours[~nonzero], minlength=HOURS)
+        return cls(alpha, offsets, positive, negative, zero_counts)
+
+    def merge(self, other):
+        """
+        Rollup of both inputs. Bucket keys do not depend on the data, so the
+        count rows are added after aligning them on the union of both bucket
+        ranges; the result equals sketching all values at once.
+        """
+        if self.alpha != other.alpha:
+            raise ValueError('can only merge rollups with the same accuracy')
+        offsets, positive, negative, zero_counts = {}, {}, {}, {}
+        for col in self.offsets:
+            parts = [part for part in (self, other) if col in part.offsets]
+            offset = min(part.offsets[col] for part in parts)
+            width = max(part.offsets[col] + part.positive[col].shape[1] for part in parts) - offset
+            for store, name in ((positive, 'positive'), (negative, 'negative')):
+                total = np.zeros((HOURS, width), dtype='int64')
+                for part in parts:
+                    start = part.offsets[col] - offset
+                    rows = getattr(part, name)[col]
+                    total[:, start:start + rows.shape[1]] += rows
+                store[col] = total
+            offsets[col] = offset
+            zero_counts[col] = sum(part.zero_counts[col] for part in parts)
+        return QuantileRollup(self.alpha, offsets, positive, negative, zero_counts)
+
+    def hour_sketch(self, column, hour):
+        return QuantileSketch(self.alpha, self.offsets[column], self.positive[column][hour],
+                              self.negative[column][hour], int(self.zero_counts[column][hour]))
+
+    def range_sketch(self, column, h0, h1):
+        """
+        The merged sketch of the inclusive hour range.
+        """
+        hours = slice(h0, h1 + 1)
+        return QuantileSketch(self.alpha, self.offsets[column], self.positive[column][hours].sum(axis=0),
+                              self.negative[column][hours].sum(axis=0),
+                              int(self.zero_counts[column][hours].sum()))
+
+    def range_quantiles(self, column, h0, h1, qs):
+        """
+        Quantile estimates of ``column`` over the inclusive hour range, each
+        within ``alpha`` relative error of the exact value; None when the range
+        holds no values.
+        """
+        if column not in self.offsets:
+            return None
+        return self.range_sketch(column, h0, h1).quantiles(qs)
+
+# Levels of the time-series pyramid, finest first, with the (nominal) hours per
+# bucket used to pick the level for a time window.
+TIME_LEVELS = {'hour': 1, 'day': 24, 'week': 24 * 7, 'month': 24 * 30}
+
+_SUM_COLUMNS = ['trips', 'fare_sum', 'fare_count', 'distance_sum', 'distance_count']
+
+
+def time_keys(hours, level):
+    """
+    Bucket key at ``level`` of each epoch hour (hours since 1970-01-01):
+    the hour itself, its day ordinal, the day ordinal of its week's Monday or
+    months since 1970-01.
+    """
+    hours = np.asarray(hours, dtype='int64')
+    if level == 'hour':
+        return hours
+    days = hours // 24
+    if level == 'day':
+        return days
+    if level == 'week':
+        # 1970-01-01 was a Thursday.
+        return days - (days + 3) % 7
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype('int64')
+
+
+def key_start_hours(keys, level):
+    """
+    Epoch hour at which each bucket key of ``level`` starts.
+    """
+    keys = np.asarray(keys, dtype='int64')
+    if level == 'hour':
+        return keys
+    if level == 'month':
+        keys = keys.astype('datetime64[M]').astype('datetime64[D]').astype('int64')
+    return keys * 24
+
+
+def time_level(start_hour, end_hour, max_points):
+    """
+    Finest level at which the window ``[start_hour, end_hour]`` spans at most
+    ``max_points`` buckets (the coarsest level otherwise).
+    """
+    for level, hours in TIME_LEVELS.items():
+        if (end_hour - start_hour) / hours <= max_points:
+            return level
+    return level
+
+
+class TimeSeriesPyramid:
+    """
+    Trip count, fare sum and distance sum per pickup hour, day, week and
+    month, each level a table indexed by bucket key (``time_keys``). The
+    time-series chart reads the level matching its visible window, so the
+    points it draws stay bounded from an hour-by-hour view to a multi-year
+    one. ``merge`` adds the tables of new trips level by level.
+    """
+
+    def __init__(self, levels, fare_scale=1, distance_scale=1):
+        self.levels = levels
+        self.fare_scale = fare_scale
+        self.distance_scale = distance_scale
+        self._starts = {level: key_start_hours(table.index.to_numpy(), level) for level, table in levels.items()}
+
+    @classmethod
+    def from_frame(cls, df):
+        epoch_hours = df['pickup_date'].to_numpy().astype('int64') * 24 + df['pickup_hour'].to_numpy()
+        hours, keys = np.unique(epoch_hours, return_inverse=True)
+        fare_sum, fare_count, fare_scale = _group_sum(keys, column_values(df, 'fare_amount'), len(hours))
+        distance_sum, distance_count, distance_scale = _group_sum(keys, column_values(df, 'trip_distance'), len(hours))
+        hourly = pd.DataFrame({
+            'trips': np.bincount(keys, minlength=len(hours)),
+            'fare_sum': fare_sum,
+            'fare_count': fare_count,
+            'distance_sum': distance_sum,
+            'distance_count': distance_count,
+        }, index=pd.Index(hours, name='bucket'))
+        # Coarser levels are sums over the (small) hourly table.
+        levels = {level: hourly if level == 'hour' else hourly.groupby(time_keys(hours, level)).sum()
+                  for level in TIME_LEVELS}
+        for table in levels.values():
+            table.index.name = 'bucket'
+        return cls(levels, fare_scale, distance_scale)
+
+    def merge(self, other):
+        fare_scale, distance_scale = self.fare_scale, self.distance_scale
+        if (self.fare_scale, self.distance_scale) != (other.fare_scale, other.distance_scale):
+            fare_scale = self.fare_scale if self.fare_scale == other.fare_scale else 1
+            distance_scale = self.distance_scale if self.distance_scale == other.distance_scale else 1
+        levels = {}
+        for level in TIME_LEVELS:
+            parts = []
+            for part in (self, other):
+                table = part.levels[level].copy()
+                if fare_scale != part.fare_scale:
+                    table['fare_sum'] = table['fare_sum'] / part.fare_scale
+                if distance_scale != part.distance_scale:
+                    table['distance_sum'] = table['distance_sum'] / part.distance_scale
+                parts.append(table)
+            dtypes = {col: np.result_type(parts[0][col].dtype, parts[1][col].dtype) for col in _SUM_COLUMNS}
+            levels[level] = parts[0].add(parts[1], fill_value=0).astype(dtypes)
+        return TimeSeriesPyramid(levels, fare_scale, distance_scale)
+
+    def extent(self):
+        """
+        ``(first, last)`` epoch hour holding trips, or None when empty.
+        """
+        hours = self._starts['hour']
+        return (int(hours[0]), int(hours[-1]) + 1) if len(hours) else None
+
+    def frame(self, level, start_hour=None, end_hour=None):
+        """
+        Per-bucket ``trips`` and mean ``fare_amount`` / ``trip_distance`` at
+        ``level``, one row per bucket in ascending order, with the bucket start
+        as ``pickup_time``; restricted to buckets overlapping
+        ``[start_hour, end_hour]`` when given.
+        """
+        table, starts = self.levels[level], self._starts[level]
+        lo, hi = 0, len(starts)
+        if start_hour is not None:
+            lo = max(int(np.searchsorted(starts, start_hour, side='right')) - 1, 0)
+        if end_hour is not None:
+            hi = int(np.searchsorted(starts, end_hour, side='right'))
+        table = table.iloc[lo:hi]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fare = table['fare_sum'] / (self.fare_scale * table['fare_count'])
+            distance = table['distance_sum'] / (self.distance_scale * table['distance_count'])
+        return pd.DataFrame({
+            'pickup_time': starts[lo:hi].astype('datetime64[h]').astype('datetime64[ns]'),
+            'fare_amount': fare.to_numpy(dtype='float64'),
+            'trip_distance': distance.to_numpy(dtype='float64'),
+            'trips': table['trips'].to_numpy(),
+        })
+
+
+class GridRollup:
+    """
+    Trip count and fare sum per spatial grid cell and pickup hour, kept for the
+    occupied cells only, with prefix sums over the hours. A map of any hour
+    range costs O(cells), independent of the number of trips.
+    """
+
+    def __init__(self, cells, trips, fare_sum, fare_count, fare_scale=1):
+        self.cells = cells
+        self.trips = trips
+        self.fare_sum = fare_sum
+        self.fare_count = fare_count
+        self.fare_scale = fare_scale
+        self._prefix = {
+            name: np.vstack([np.zeros((1, len(cells)), dtype=getattr(self, name).dtype),
+                             np.cumsum(getattr(self, name), axis=0)])
+            for name in ('trips', 'fare_sum', 'fare_count')
+        }
+
+    @classmethod
+    def from_frame(cls, df, cell_column):
+        hours = df['pickup_hour'].to_numpy(dtype='int64')
+        cells = df[cell_column].to_numpy()
+        inside = cells != NO_CELL
+        keys = hours[inside] * CELL_COUNT + cells[inside].astype('int64')
+        fare_sum, fare_count, fare_scale = _group_sum(
+            keys, column_values(df, 'fare_amount')[inside], HOURS * CELL_COUNT)
+        trips = np.bincount(keys, minlength=HOURS * CELL_COUNT).reshape(HOURS, CELL_COUNT)
+        occupied = np.flatnonzero(trips.sum(axis=0))
+        return cls(occupied, trips[:, occupied], fare_sum.reshape(HOURS, CELL_COUNT)[:, occupied],
+                   fare_count.reshape(HOURS, CELL_COUNT)[:, occupied], fare_scale)
+
+    def merge(self, other):
+        """
+        Rollup of both inputs over the union of their occupied cells.
+        """
+        cells = np.union1d(self.cells, other.cells)
+        totals = {name: np.zeros((HOURS, len(cells)), dtype='int64') for name in ('trips', 'fare_count')}
+        fare_scale = self.fare_scale if self.fare_scale == other.fare_scale else 1
+        fare_sum = np.zeros((HOURS, len(cells)), dtype='int64' if fare_scale != 1 else 'float64')
+        for part in (self, other):
+            columns = np.searchsorted(cells, part.cells)
+            for name, total in totals.items():
+                total[:, columns] += getattr(part, name)
+            if fare_scale == part.fare_scale:
+                fare_sum[:, columns] += part.fare_sum
+            else:
+                fare_sum[:, columns] += part.fare_sum / part.fare_scale
+        return GridRollup(cells, totals['trips'], fare_sum, totals['fare_count'], fare_scale)
+
+    def range_cells(self, h0, h1):
+        """
+        ``(cells, trips, fare_sum, avg_fare)`` over the inclusive hour range
+        for the cells with at least one trip in it.
+        """
+        totals = {name: prefix[h1 + 1] - prefix[h0] for name, prefix in self._prefix.items()}
+        keep = totals['trips'] > 0
+        fare_sum = totals['fare_sum'][keep] / self.fare_scale
+        with np.errstate(invalid='ignore', divide='ignore'):
+            avg_fare = fare_sum / totals['fare_count'][keep]
+        return self.cells[keep], totals['trips'][keep], fare_sum, avg_fare
@@ -1,27 +1,185 @@
+import logging
+import os
+import threading
+import time
+
 import dash
 from dash import dcc, html, callback_context
 from dash.dependencies import Input, Output, State
-import plotly.express as px
+from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
+import plotly.io as pio
+import numpy as np
 import pandas as pd
 
+from aggregates import QUANTILE_RELATIVE_ACCURACY, TIME_LEVELS, time_level
+from caching import background_callback_manager, init_cache, memoize_callback, set_dataset_version
+from dataset import HourIndexedTrips
+from export import init_export
+from ingest import (
+    appended_version, dataset_version, load_partitioned_trips, load_shared_trips, load_trips, load_weather,
+    partition_files, read_weather
+)
+from memory_report import log_memory
+from metrics import init_metrics, instrument_callback
+from query import PRECIPITATION_BUCKETS, filters_active
+from refresh import REFRESH_INTERVAL, PartitionWatcher
+from schema import log_memory_footprint
+from snapshot import DatasetSnapshot
+from spatial import cell_centers
+from startup import DatasetLoader, init_startup, probe_first_byte
+from weather import WEATHER_FILENAME
+
 
-df = pd.read_csv('merged_data.csv')
-df['tpep_pickup_datetime'] = pd.to_datetime(df['tpep_pickup_datetime'])
-df['tpep_dropoff_datetime'] = pd.to_datetime(df['tpep_dropoff_datetime'])
+logging.basicConfig(level=os.environ.get('TAXI_LOG_LEVEL', 'INFO'),
+                    format='%(asctime)s %(name)s %(levelname)s %(message)s')
+logger = logging.getLogger(__name__)
 
-# Create derived features
-df['pickup_hour'] = df['tpep_pickup_datetime'].dt.hour
-df['pickup_date'] = df['tpep_pickup_datetime'].dt.date
+DATA_PATH = os.environ.get('TAXI_DATA_PATH', 'merged_data.csv')
+
+# With TAXI_SHARED_MEMORY=1 every worker maps one read-only Arrow snapshot of
+# the table instead of holding a private copy.
+SHARED_MEMORY = os.environ.get('TAXI_SHARED_MEMORY', '0') == '1'
+
+# With TAXI_BACKGROUND_LOAD=1 the server starts answering (layout, /ready,
+# /metrics) at once and the dataset loads in a background thread; data
+# callbacks wait for it. The default loads before the module finishes
+# importing, which suits preloading servers.
+BACKGROUND_LOAD = os.environ.get('TAXI_BACKGROUND_LOAD', '0') == '1'
 
 # Define categorical and numerical columns
 categorical_columns = ['VendorID', 'RatecodeID', 'payment_type']
 numerical_columns = [
     'passenger_count', 'trip_distance', 'fare_amount',
     'extra', 'mta_tax', 'tip_amount', 'tolls_amount',
-    'total_amount', 'PRCP'
+    'total_amount', 'PRCP',
+    # Derived at ingest (features.py)
+    'trip_duration', 'avg_speed', 'tip_pct'
 ]
 
+HISTOGRAM_BINS = 30
+
+# Values of the map's location selector, each with a grid rollup and a
+# '<location>_cell' column.
+MAP_LOCATIONS = ['pickup', 'dropoff']
+
+# Display names of the coded columns offered as filters (TLC data dictionary).
+PAYMENT_TYPES = {1: 'Credit card', 2: 'Cash', 3: 'No charge', 4: 'Dispute', 5: 'Unknown', 6: 'Voided trip'}
+VENDORS = {1: 'Creative Mobile Technologies', 2: 'VeriFone'}
+RATECODES = {1: 'Standard rate', 2: 'JFK', 3: 'Newark', 4: 'Nassau or Westchester', 5: 'Negotiated fare',
+             6: 'Group ride'}
+PRECIPITATION_LABELS = {'dry': 'Dry (< 0.01 in)', 'light': 'Light (0.01-0.1 in)',
+                        'moderate': 'Moderate (0.1-0.5 in)', 'heavy': 'Heavy (0.5 in or more)'}
+
+# Contents of the filters store while nothing beyond the hour slider is set;
+# callbacks then read the precomputed rollups, otherwise the query layer.
+DEFAULT_FILTERS = {'start_date': None, 'end_date': None, 'payment_type': [], 'VendorID': [], 'RatecodeID': [],
+                   'precipitation': [], 'valid_only': False}
+
+def require_choice(value, choices):
+    """
+    Leaves a callback's outputs unchanged unless ``value`` is one of the
+    ``choices`` its control offers: inputs can be posted directly, and column
+    names end up in the query layer's SQL.
+    """
+    if value not in choices:
+        raise PreventUpdate
+
+
+# Set by load_dataset() and replaced as a whole by refresh_dataset(); callbacks
+# read it once dataset_loader is ready, and only once per call.
+dataset = None
+partition_watcher = None
+
+
+def load_dataset():
+    """
+    Loads the trip table and weather and builds every precomputed aggregate
+    into the dataset snapshot the callbacks read.
+    """
+    global dataset, partition_watcher
+
+    # With TAXI_REFRESH_INTERVAL set, a dataset directory is loaded from one
+    # listing of its partition files, and files added later are appended by
+    # the watcher.
+    watch = REFRESH_INTERVAL > 0 and os.path.isdir(DATA_PATH)
+    partitions = partition_files(DATA_PATH) if watch else None
+
+    # Typed trip table with the derived pickup_hour / pickup_date columns; parsed
+    # from the CSV on first start and read from the Parquet cache afterwards.
+    # Rows are sorted by pickup_hour, so trips.hour_slice(h0, h1) is a cached,
+    # zero-copy view of any hour range.
+    log_memory('before dataset load')
+    if watch:
+        loaded = HourIndexedTrips(load_partitioned_trips(DATA_PATH, files=partitions))
+    else:
+        loaded = HourIndexedTrips(load_shared_trips(DATA_PATH) if SHARED_MEMORY else load_trips(DATA_PATH))
+    log_memory('after dataset load' + (' (shared memory)' if SHARED_MEMORY and not watch else ''))
+    log_memory_footprint(loaded.df)
+
+    # Daily weather is a per-day dimension table, joined onto trips by pickup_date
+    # only where a weather column is read (column_values(..., weather)).
+    loaded_weather = load_weather(DATA_PATH)
+
+    dataset = DatasetSnapshot.build(dataset_version(DATA_PATH, files=partitions), loaded, loaded_weather,
+                                    categorical_columns, numerical_columns, HISTOGRAM_BINS)
+
+    # Figure callbacks are memoized under the version of the data just loaded.
+    set_dataset_version(dataset.version)
+
+    if watch:
+        partition_watcher = PartitionWatcher(DATA_PATH, partitions, refresh_dataset).start()
+
+    # Only the time-series chart uses plotly.express; import it here rather
+    # than on the serving path or in its first callback.
+    import plotly.express  # noqa: F401
+
+
+def refresh_dataset(new_files):
+    """
+    Appends the trips of the partition files ``new_files`` (a listing
+    relative to DATA_PATH) to the loaded dataset and publishes the result.
+    Reads only those files and aggregates only their rows.
+    """
+    global dataset
+
+    current = dataset
+    start = time.perf_counter()
+    new_trips = load_partitioned_trips(DATA_PATH, files=new_files)
+    weather_path = os.path.join(DATA_PATH, WEATHER_FILENAME)
+    weather = current.weather.merge(read_weather(weather_path)) if os.path.exists(weather_path) \
+        else current.weather
+    refreshed = current.append(appended_version(current.version, new_files), new_trips, weather)
+    # One assignment publishes the new snapshot; the version is switched after
+    # it, so an output keyed by the new version is never built from old data.
+    dataset = refreshed
+    set_dataset_version(refreshed.version)
+    logger.info('appended %d trips from %d partition file(s) in %.2fs (%d trips, version %s)',
+                len(new_trips), len(new_files), time.perf_counter() - start, len(refreshed.trips),
+                refreshed.version)
+
+
+dataset_loader = DatasetLoader(load_dataset)
+
+# Upper bound on the points drawn in the Relationship scatter; the trendline
+# always uses every trip in the range.
+SCATTER_MAX_POINTS = int(os.environ.get('TAXI_SCATTER_MAX_POINTS', '20000'))
+
+# Points of the quick preview the scatter shows while its full-resolution
+# figure is rendered in the background.
+SCATTER_PREVIEW_POINTS = int(os.environ.get('TAXI_SCATTER_PREVIEW_POINTS', '2000'))
+
+# How often (ms) the browser polls a running background callback.
+BACKGROUND_POLL_INTERVAL = 250
+
+# Most time-series buckets in the visible window: the chart shows the finest
+# level (hour, day, week, month) within this bound. A figure is drawn over the
+# window's tile (see timeseries_tile): four steps of the window span rounded up
+# to a power-of-two number of buckets, so at most 4 * 2**ceil(log2(bound))
+# points, 2048 for the default 500.
+TIMESERIES_MAX_POINTS = int(os.environ.get('TAXI_TIMESERIES_MAX_POINTS', '500'))
+LEVEL_LABELS = {'hour': 'hourly', 'day': 'daily', 'week': 'weekly', 'month': 'monthly'}
+
 
 LIGHT_THEME = {
     'background': '#f8f9fa',
@@ -40,8 +198,135 @@ DARK_THEME = {
 }
 
 
-app = dash.Dash(__name__)
+def theme_container_styles(theme):
+    """
+    CSS for the main container, header, each tab container and the filter bar
+    in the given theme.
+    """
+    if theme == 'dark':
+        main_style = {
+            'fontFamily': 'Arial',
+            'backgroundColor': DARK_THEME['background'],
+            'color': DARK_THEME['text']
+        }
+        header_style = {
+            'backgroundColor': DARK_THEME['header'],
+            'color': DARK_THEME['text'],
+            'padding': '10px'
+        }
+        container_style = {
+            'backgroundColor': DARK_THEME['subcontainer'],
+            'color': DARK_THEME['text'],
+            'borderRadius': '10px',
+            'padding': '10px'
+        }
+    else:
+        main_style = {
+            'fontFamily': 'Arial',
+            'backgroundColor': LIGHT_THEME['background'],
+            'color': LIGHT_THEME['text']
+        }
+        header_style = {
+            'backgroundColor': LIGHT_THEME['header'],
+            'color': LIGHT_THEME['text'],
+            'padding': '10px'
+        }
+        container_style = {
+            'backgroundColor': LIGHT_THEME['subcontainer'],
+            'color': LIGHT_THEME['text'],
+            'borderRadius': '10px',
+            'padding': '10px'
+        }
+    
+    # The filter bar lays its controls out in a row.
+    filters_style = dict(container_style, display='flex', justifyContent='space-around', alignItems='flex-end',
+                         flexWrap='wrap')
+    return (main_style, header_style, container_style, container_style, container_style, container_style,
+            filters_style)
+
+
+
+def theme_tabs_style(theme):
+    """
+    Style of the Tabs in the given theme.
+    - 'style' controls the outer tab container's appearance (text color, background).
+    - 'colors' controls the border, primary (selected tab), and background colors.
+    """
+    if theme == 'dark':
+        # Dark mode
+        tabs_style = {
+            'height': '44px',
+            'backgroundColor': DARK_THEME['header'],   # or #2c3e50
+            'color': DARK_THEME['text']
+        }
+        tabs_colors = {
+            'border': DARK_THEME['header'],  # border color
+            'primary': '#2980b9',            # highlight color for selected tab
+            'background': DARK_THEME['header']
+        }
+    else:
+        # Light mode
+        tabs_style = {
+            'height': '44px',
+            'backgroundColor': LIGHT_THEME['header'],
+            'color': LIGHT_THEME['text']
+        }
+        tabs_colors = {
+            'border': LIGHT_THEME['header'],
+            'primary': '#3498db',
+            'background': LIGHT_THEME['header']
+        }
+    
+    return tabs_style, tabs_colors
+
+
+def theme_dropdown_styles(theme):
+    """
+    Dropdown styles that keep backgrounds and text visible in both light and dark modes.
+    """
+    if theme == 'dark':
+        dropdown_style = {'backgroundColor': '#34495e', 'color': '#ecf0f1'}
+        return (dropdown_style,) * 9
+    else:
+        dropdown_style = {'backgroundColor': '#ffffff', 'color': '#2c3e50'}
+        return (dropdown_style,) * 9
+
+
+# Every themed style is static, so it is computed once here and applied in the
+# browser by clientside callbacks: switching theme costs no server round trip.
+FIGURE_TEMPLATES = {'light': 'plotly_white', 'dark': 'plotly_dark'}
+MAPBOX_STYLES = {'light': 'carto-positron', 'dark': 'carto-darkmatter'}
+THEME_STYLES = {
+    theme: {
+        'containers': theme_container_styles(theme),
+        'tabs': theme_tabs_style(theme),
+        'dropdowns': theme_dropdown_styles(theme),
+        'figure_template': pio.templates[FIGURE_TEMPLATES[theme]].to_plotly_json(),
+        'mapbox_style': MAPBOX_STYLES[theme]
+    }
+    for theme in FIGURE_TEMPLATES
+}
+
+
+# The heavy scatter runs as a background job in a forked process, so a slow
+# render neither blocks a server thread nor queues other users behind it.
+app = dash.Dash(__name__, background_callback_manager=background_callback_manager())
 app.title = "NYC Taxi Analysis Dashboard"
+server = app.server
+
+# Figure callbacks are memoized on their inputs in an on-disk store shared by
+# all workers, keyed by the dataset version (set once the dataset is loaded).
+init_cache(app.server, None)
+
+# Callback latency, response size and cache hit/miss histograms at /metrics;
+# TAXI_PROFILE_RATE samples requests with cProfile.
+init_metrics(app.server)
+
+# /ready readiness endpoint and startup timing (time to first byte).
+init_startup(app.server, dataset_loader)
+
+# /export.csv and /export.parquet stream the trips behind the current filters.
+init_export(app.server, lambda: dataset.trip_query if dataset_loader.status() == 'ready' else None)
 
 app.layout = html.Div([
     # Header with Title and Theme Toggle
@@ -60,11 +345,81 @@ app.layout = html.Div([
                     value='light',
                     labelStyle={'display': 'inline-block', 'marginRight': '10px'}
                 )
-            ], style={'textAlign': 'center', 'padding': '10px'})
+            ], style={'textAlign': 'center', 'padding': '10px'}),
+            # Loading notice while the dataset loads in the background
+            html.Div(id='dataset-status', style={'textAlign': 'center', 'fontSize': '16px'}),
+            dcc.Interval(id='dataset-poll', interval=1000)
+        ]
+    ),
+
+    # Filters shared by every tab, on top of the pickup hour slider
+    html.Div(
+        id='filters-container',
+        children=[
+            html.Div([
+                html.Label('Pickup dates:', style={'fontSize': '16px'}),
+                dcc.DatePickerRange(
+                    id='date-filter',
+                    clearable=True,
+                    display_format='YYYY-MM-DD'
+                )
+            ], style={'padding': '10px'}),
+            html.Div([
+                html.Label('Payment type:', style={'fontSize': '16px'}),
+                dcc.Dropdown(
+                    id='payment-filter',
+                    options=[{'label': label, 'value': code} for code, label in PAYMENT_TYPES.items()],
+                    multi=True,
+                    placeholder='All'
+                )
+            ], style={'width': '18%', 'padding': '10px'}),
+            html.Div([
+                html.Label('Vendor:', style={'fontSize': '16px'}),
+                dcc.Dropdown(
+                    id='vendor-filter',
+                    options=[{'label': label, 'value': code} for code, label in VENDORS.items()],
+                    multi=True,
+                    placeholder='All'
+                )
+            ], style={'width': '18%', 'padding': '10px'}),
+            html.Div([
+                html.Label('Rate code:', style={'fontSize': '16px'}),
+                dcc.Dropdown(
+                    id='ratecode-filter',
+                    options=[{'label': label, 'value': code} for code, label in RATECODES.items()],
+                    multi=True,
+                    placeholder='All'
+                )
+            ], style={'width': '18%', 'padding': '10px'}),
+            html.Div([
+                html.Label('Precipitation:', style={'fontSize': '16px'}),
+                dcc.Dropdown(
+                    id='precipitation-filter',
+                    options=[{'label': PRECIPITATION_LABELS[bucket], 'value': bucket}
+                             for bucket in PRECIPITATION_BUCKETS],
+                    multi=True,
+                    placeholder='All'
+                )
+            ], style={'width': '18%', 'padding': '10px'}),
+            html.Div([
+                html.Label('Data quality:', style={'fontSize': '16px'}),
+                dcc.Checklist(
+                    id='quality-filter',
+                    options=[{'label': ' Exclude invalid trips', 'value': 'valid_only'}],
+                    value=[],
+                    style={'paddingTop': '8px'}
+                )
+            ], style={'padding': '10px'}),
+            html.Div([
+                html.Label('Download trips:', style={'fontSize': '16px'}),
+                html.Div([
+                    html.A('CSV', id='export-csv', href='/export.csv', style={'marginRight': '10px'}),
+                    html.A('Parquet', id='export-parquet', href='/export.parquet')
+                ], style={'paddingTop': '8px'})
+            ], style={'padding': '10px'})
         ]
     ),
 
-    
     dcc.Tabs(
         id='tabs',
         value='overview',
@@ -90,6 +445,37 @@ app.layout = html.Div([
                             ], className='metric-card')
                         ], style={'display': 'flex', 'justifyContent': 'space-around', 'margin': '20px'}),
 
+                        # Percentile Cards (from the per-hour quantile sketches)
+                        html.Div([
+                            html.Div([
+                                html.Label('Percentiles of:', style={'fontSize': '18px'}),
+                                dcc.Dropdown(
+                                    id='quantile-variable',
+                                    options=[{'label': col, 'value': col} for col in numerical_columns],
+                                    value='fare_amount',
+                                    clearable=False,
+                                    style={'width': '100%'}
+                                ),
+                                html.Div(
+                                    id='quantile-accuracy',
+                                    style={'fontSize': '13px', 'marginTop': '8px'}
+                                )
+                            ], style={'width': '20%', 'padding': '10px'}),
+                            html.Div([
+                                html.H4("Median (p50)"),
+                                html.H2(id='quantile-p50')
+                            ], className='metric-card'),
+                            html.Div([
+                                html.H4("p90"),
+                                html.H2(id='quantile-p90')
+                            ], className='metric-card'),
+                            html.Div([
+                                html.H4("p99"),
+                                html.H2(id='quantile-p99')
+                            ], className='metric-card')
+                        ], style={'display': 'flex', 'justifyContent': 'space-around', 'alignItems': 'center',
+                                  'margin': '20px'}),
+
                         # Hour Slider Filter
                         html.Div([
                             html.Label('Filter by Pickup Hour:', style={'fontSize': '18px', 'fontWeight': 'bold'}),
@@ -230,149 +616,300 @@ app.layout = html.Div([
                         # Time Series Chart
                         dcc.Graph(id='timeseries-chart'),
                         html.Div(
-                            "The time series analysis above shows how the selected metric changes over days. "
-                            "This helps identify trends, peak days, or anomalies in the data.",
+                            "The time series analysis above shows how the selected metric changes over time. "
+                            "This helps identify trends, peak days, or anomalies in the data. Zoom in for "
+                            "hourly detail or out for weekly and monthly totals.",
+                            style={'padding': '20px', 'fontSize': '16px', 'textAlign': 'center'}
+                        )
+                    ]
+                )
+            ]),
+
+            # --------------- MAP TAB ---------------
+            dcc.Tab(label='Map', value='map', children=[
+                html.Div(
+                    id='map-container',
+                    children=[
+                        html.H2("Pickup & Dropoff Density", style={'textAlign': 'center', 'margin': '20px'}),
+
+                        html.Div([
+                            html.Div([
+                                html.Label('Locations:', style={'fontSize': '18px'}),
+                                dcc.RadioItems(
+                                    id='map-location',
+                                    options=[
+                                        {'label': f'{location.capitalize()}s', 'value': location}
+                                        for location in MAP_LOCATIONS
+                                    ],
+                                    value='pickup',
+                                    labelStyle={'display': 'inline-block', 'marginRight': '10px'}
+                                )
+                            ], style={'width': '40%', 'padding': '10px'}),
+
+                            html.Div([
+                                html.Label('Weight by:', style={'fontSize': '18px'}),
+                                dcc.RadioItems(
+                                    id='map-metric',
+                                    options=[
+                                        {'label': 'Trips', 'value': 'trips'},
+                                        {'label': 'Total Fare', 'value': 'fare'}
+                                    ],
+                                    value='trips',
+                                    labelStyle={'display': 'inline-block', 'marginRight': '10px'}
+                                )
+                            ], style={'width': '40%', 'padding': '10px'})
+                        ], style={'display': 'flex', 'justifyContent': 'space-around'}),
+
+                        dcc.Graph(id='density-map', style={'height': '650px'}),
+                        html.Div(
+                            "Density of trips over a ~500 m grid, for the pickup hours selected on the Overview tab. "
+                            "Hover over an area to see its trip count and average fare.",
                             style={'padding': '20px', 'fontSize': '16px', 'textAlign': 'center'}
                         )
                     ]
                 )
             ])
         ]
-    )
+    ),
+
+    # Precomputed light/dark styles and figure templates for the clientside theme callbacks
+    dcc.Store(id='theme-styles', data=THEME_STYLES),
+
+    # Current filter selection, assembled in the browser from the filter controls
+    dcc.Store(id='filters', data=DEFAULT_FILTERS)
 ], id='main-div')
 
 
 
-@app.callback(
+app.clientside_callback(
+    """
+    function(theme, styles) {
+        const containers = styles[theme].containers;
+        const tabs = styles[theme].tabs;
+        return [
+            containers[0], containers[1], containers[2], containers[3], containers[4], containers[5],
+            containers[6],
+            tabs[0], tabs[1]
+        ].concat(styles[theme].dropdowns);
+    }
+    """,
     [
         Output('main-div', 'style'),
         Output('header', 'style'),
         Output('overview-container', 'style'),
         Output('relationship-container', 'style'),
-        Output('timeseries-container', 'style')
+        Output('timeseries-container', 'style'),
+        Output('map-container', 'style'),
+        Output('filters-container', 'style'),
+        Output('tabs', 'style'),
+        Output('tabs', 'colors'),
+        Output('variable-selector', 'style'),
+        Output('var-a-selector', 'style'),
+        Output('var-b-selector', 'style'),
+        Output('timeseries-metric', 'style'),
+        Output('quantile-variable', 'style'),
+        Output('payment-filter', 'style'),
+        Output('vendor-filter', 'style'),
+        Output('ratecode-filter', 'style'),
+        Output('precipitation-filter', 'style')
     ],
-    [Input('theme-toggle', 'value')]
+    [Input('theme-toggle', 'value')],
+    [State('theme-styles', 'data')]
 )
-def update_theme(theme):
+
+
+# Restyle the figures already on screen by swapping only their layout
+# template; the server callbacks read the theme as State and are not rerun.
+app.clientside_callback(
     """
-    Dynamically updates the CSS for the main container, header,
-    and each tab container to reflect the chosen theme.
+    function(theme, styles, ...figures) {
+        const template = styles[theme].figure_template;
+        return figures.map(function(fig) {
+            if (!fig) {
+                return window.dash_clientside.no_update;
+            }
+            const layout = Object.assign({}, fig.layout, {template: template});
+            if (layout.mapbox) {
+                layout.mapbox = Object.assign({}, layout.mapbox, {style: styles[theme].mapbox_style});
+            }
+            return Object.assign({}, fig, {layout: layout});
+        });
+    }
+    """,
+    [
+        Output('single-variable-chart', 'figure', allow_duplicate=True),
+        Output('scatter-plot', 'figure', allow_duplicate=True),
+        Output('timeseries-chart', 'figure', allow_duplicate=True),
+        Output('density-map', 'figure', allow_duplicate=True)
+    ],
+    [Input('theme-toggle', 'value')],
+    [
+        State('theme-styles', 'data'),
+        State('single-variable-chart', 'figure'),
+        State('scatter-plot', 'figure'),
+        State('timeseries-chart', 'figure'),
+        State('density-map', 'figure')
+    ],
+    prevent_initial_call=True
+)
+
+
+# Collect the filter controls into the filters store; the data callbacks take
+# the store as one input.
+app.clientside_callback(
     """
-    if theme == 'dark':
-        main_style = {
-            'fontFamily': 'Arial',
-            'backgroundColor': DARK_THEME['background'],
-            'color': DARK_THEME['text']
+    function(startDate, endDate, paymentTypes, vendors, ratecodes, precipitation, quality) {
+        function sorted(values) {
+            return (values || []).slice().sort();
         }
-        header_style = {
-            'backgroundColor': DARK_THEME['header'],
-            'color': DARK_THEME['text'],
-            'padding': '10px'
-        }
-        container_style = {
-            'backgroundColor': DARK_THEME['subcontainer'],
-            'color': DARK_THEME['text'],
-            'borderRadius': '10px',
-            'padding': '10px'
-        }
-    else:
-        main_style = {
-            'fontFamily': 'Arial',
-            'backgroundColor': LIGHT_THEME['background'],
-            'color': LIGHT_THEME['text']
+        return {
+            start_date: startDate || null,
+            end_date: endDate || null,
+            payment_type: sorted(paymentTypes),
+            VendorID: sorted(vendors),
+            RatecodeID: sorted(ratecodes),
+            precipitation: sorted(precipitation),
+            valid_only: (quality || []).indexOf('valid_only') >= 0
+        };
+    }
+    """,
+    Output('filters', 'data'),
+    [
+        Input('date-filter', 'start_date'),
+        Input('date-filter', 'end_date'),
+        Input('payment-filter', 'value'),
+        Input('vendor-filter', 'value'),
+        Input('ratecode-filter', 'value'),
+        Input('precipitation-filter', 'value'),
+        Input('quality-filter', 'value')
+    ],
+    prevent_initial_call=True
+)
+
+
+# Point the download links at the export endpoints with the current filters
+# and hour range.
+app.clientside_callback(
+    """
+    function(filters, hourRange) {
+        const params = new URLSearchParams();
+        params.set('hours', hourRange[0] + '-' + hourRange[1]);
+        if (filters.start_date) {
+            params.set('start_date', filters.start_date);
         }
-        header_style = {
-            'backgroundColor': LIGHT_THEME['header'],
-            'color': LIGHT_THEME['text'],
-            'padding': '10px'
+        if (filters.end_date) {
+            params.set('end_date', filters.end_date);
         }
-        container_style = {
-            'backgroundColor': LIGHT_THEME['subcontainer'],
-            'color': LIGHT_THEME['text'],
-            'borderRadius': '10px',
-            'padding': '10px'
+        ['payment_type', 'VendorID', 'RatecodeID', 'precipitation'].forEach(function(name) {
+            if (filters[name].length) {
+                params.set(name, filters[name].join(','));
+            }
+        });
+        if (filters.valid_only) {
+            params.set('valid_only', '1');
         }
-    
-    return main_style, header_style, container_style, container_style, container_style
+        const query = '?' + params.toString();
+        return ['/export.csv' + query, '/export.parquet' + query];
+    }
+    """,
+    [
+        Output('export-csv', 'href'),
+        Output('export-parquet', 'href')
+    ],
+    [
+        Input('filters', 'data'),
+        Input('hour-slider', 'value')
+    ]
+)
 
 
 
 @app.callback(
-    [Output('tabs', 'style'), Output('tabs', 'colors')],
-    [Input('theme-toggle', 'value')]
+    [Output('dataset-status', 'children'),
+     Output('dataset-poll', 'disabled')],
+    [Input('dataset-poll', 'n_intervals')]
 )
-def update_tabs_style(theme):
+def update_dataset_status(n_intervals):
     """
-    Dynamically style the Tabs. 
-    - 'style' controls the outer tab container's appearance (text color, background).
-    - 'colors' controls the border, primary (selected tab), and background colors.
+    Shows a notice in the header until the dataset is loaded, then stops
+    polling.
     """
-    if theme == 'dark':
-        # Dark mode
-        tabs_style = {
-            'height': '44px',
-            'backgroundColor': DARK_THEME['header'],   # or #2c3e50
-            'color': DARK_THEME['text']
-        }
-        tabs_colors = {
-            'border': DARK_THEME['header'],  # border color
-            'primary': '#2980b9',            # highlight color for selected tab
-            'background': DARK_THEME['header']
-        }
-    else:
-        # Light mode
-        tabs_style = {
-            'height': '44px',
-            'backgroundColor': LIGHT_THEME['header'],
-            'color': LIGHT_THEME['text']
-        }
-        tabs_colors = {
-            'border': LIGHT_THEME['header'],
-            'primary': '#3498db',
-            'background': LIGHT_THEME['header']
-        }
-    
-    return tabs_style, tabs_colors
+    status = dataset_loader.status()
+    if status == 'loading':
+        return "Loading the dataset; the charts appear as soon as it is ready.", False
+    if status == 'failed':
+        return "The dataset failed to load; see the server log.", True
+    return None, True
 
 
 @app.callback(
+    [Output('total-trips', 'children'),
+     Output('avg-fare', 'children'),
+     Output('avg-distance', 'children')],
     [
-        Output('variable-selector', 'style'),
-        Output('var-a-selector', 'style'),
-        Output('var-b-selector', 'style'),
-        Output('timeseries-metric', 'style')
-    ],
-    [Input('theme-toggle', 'value')]
+        Input('hour-slider', 'value'),
+        Input('filters', 'data')
+    ]
 )
-def update_all_dropdown_styles(theme):
+@instrument_callback
+@dataset_loader.requires_dataset
+@memoize_callback
+def update_metrics(hour_range, filters):
     """
-    Ensures dropdown backgrounds and text are visible in both light and dark modes.
+    Updates the summary metrics (Total Trips, Average Fare, and Average Distance)
+    based on the current pickup hour filter and the dashboard filters.
     """
-    if theme == 'dark':
-        dropdown_style = {'backgroundColor': '#34495e', 'color': '#ecf0f1'}
-        return (dropdown_style, dropdown_style, dropdown_style, dropdown_style)
+    data = dataset
+    if filters_active(filters):
+        total_trips, mean_fare, mean_distance = data.trip_query.metrics(hour_range, filters)
     else:
-        dropdown_style = {'backgroundColor': '#ffffff', 'color': '#2c3e50'}
-        return (dropdown_style, dropdown_style, dropdown_style, dropdown_style)
+        total_trips, mean_fare, mean_distance = data.hourly_rollup.range_metrics(hour_range[0], hour_range[1])
+    avg_fare = f"${mean_fare:.2f}" if total_trips > 0 else "$0.00"
+    avg_distance = f"{mean_distance:.2f} mi" if total_trips > 0 else "0.00 mi"
+    return total_trips, avg_fare, avg_distance
+
 
+# Display units of the percentile cards; other columns are shown as plain numbers.
+QUANTILE_FORMATS = {
+    'fare_amount': '${:.2f}', 'extra': '${:.2f}', 'mta_tax': '${:.2f}', 'tip_amount': '${:.2f}',
+    'tolls_amount': '${:.2f}', 'total_amount': '${:.2f}', 'trip_distance': '{:.2f} mi', 'PRCP': '{:.2f} in',
+    'passenger_count': '{:.0f}', 'trip_duration': '{:.1f} min', 'avg_speed': '{:.1f} mph', 'tip_pct': '{:.1f}%',
+}
 
 
 @app.callback(
-    [Output('total-trips', 'children'),
-     Output('avg-fare', 'children'),
-     Output('avg-distance', 'children')],
-    [Input('hour-slider', 'value')]
+    [Output('quantile-p50', 'children'),
+     Output('quantile-p90', 'children'),
+     Output('quantile-p99', 'children'),
+     Output('quantile-accuracy', 'children')],
+    [
+        Input('quantile-variable', 'value'),
+        Input('hour-slider', 'value'),
+        Input('filters', 'data')
+    ]
 )
-def update_metrics(hour_range):
+@instrument_callback
+@dataset_loader.requires_dataset
+@memoize_callback
+def update_quantiles(variable, hour_range, filters):
     """
-    Updates the summary metrics (Total Trips, Average Fare, and Average Distance)
-    based on the current pickup hour filter.
+    Shows the p50/p90/p99 of the chosen variable over the pickup hour filter,
+    merged from the per-hour quantile sketches, or computed exactly by the
+    query layer when other filters are set; only sketch estimates are marked
+    approximate.
     """
-    filtered_df = df[(df['pickup_hour'] >= hour_range[0]) & (df['pickup_hour'] <= hour_range[1])]
-    total_trips = len(filtered_df)
-    avg_fare = f"${filtered_df['fare_amount'].mean():.2f}" if total_trips > 0 else "$0.00"
-    avg_distance = f"{filtered_df['trip_distance'].mean():.2f} mi" if total_trips > 0 else "0.00 mi"
-    return total_trips, avg_fare, avg_distance
+    require_choice(variable, numerical_columns)
+    data = dataset
+    if filters_active(filters):
+        estimates = data.trip_query.quantiles(variable, hour_range, filters, [0.5, 0.9, 0.99])
+        prefix, accuracy = '', "Exact values over the filtered trips."
+    else:
+        estimates = data.quantile_rollup.range_quantiles(variable, hour_range[0], hour_range[1], [0.5, 0.9, 0.99])
+        prefix, accuracy = '≈ ', f"Estimated within ±{QUANTILE_RELATIVE_ACCURACY:.0%} of the exact value."
+    if estimates is None:
+        return "–", "–", "–", ""
+    fmt = QUANTILE_FORMATS.get(variable, '{:.2f}')
+    return tuple(prefix + fmt.format(value) for value in estimates) + (accuracy,)
 
 
 
@@ -383,42 +920,94 @@ def update_metrics(hour_range):
         Input('variable-selector', 'value'),
         Input('orientation-selector', 'value'),
         Input('hour-slider', 'value'),
-        Input('theme-toggle', 'value')
-    ]
+        Input('filters', 'data')
+    ],
+    [State('theme-toggle', 'value')]
 )
-def update_single_variable_chart(selected_var, orientation, hour_range, theme):
+@instrument_callback
+@dataset_loader.requires_dataset
+@memoize_callback
+def update_single_variable_chart(selected_var, orientation, hour_range, filters, theme):
     """
     Displays either a bar chart (for categorical variables) or a histogram (for numerical variables),
     with orientation toggle and the current theme for styling.
     """
-    filtered_df = df[(df['pickup_hour'] >= hour_range[0]) & (df['pickup_hour'] <= hour_range[1])]
-    if selected_var is None or filtered_df.empty:
+    if selected_var is not None:
+        require_choice(selected_var, categorical_columns + numerical_columns)
+    data = dataset
+    h0, h1 = hour_range
+    if selected_var is None or data.trips.range_size(h0, h1) == 0:
         return go.Figure(), "No data available for the selected range."
+    filtered = filters_active(filters)
     
     # Prepare the figure
     if selected_var in categorical_columns:
-        value_counts = filtered_df[selected_var].value_counts()
+        if filtered:
+            values, counts = data.trip_query.value_counts(selected_var, hour_range, filters)
+        else:
+            values, counts = data.category_rollup.range_value_counts(selected_var, h0, h1)
+        if len(counts) == 0:
+            return go.Figure(), "No data available for the selected range."
         if orientation == 'v':
             fig = go.Figure(go.Bar(
-                x=value_counts.index,
-                y=value_counts.values,
+                x=values,
+                y=counts,
                 marker_color='#3498db'
             ))
         else:
             fig = go.Figure(go.Bar(
-                y=value_counts.index,
-                x=value_counts.values,
+                y=values,
+                x=counts,
                 orientation='h',
                 marker_color='#3498db'
             ))
         description = f"This bar chart shows the frequency distribution of '{selected_var}'."
     else:
-        # For numerical variable, create a histogram
+        # For numerical variable, bin server-side and ship only edges and counts
+        histogram_rollup = data.histogram_rollup
+        if not filtered:
+            binned = histogram_rollup.range_histogram(selected_var, h0, h1)
+        elif filters.get('valid_only'):
+            # Invalid trips (negative durations, absurd speeds) stretch the
+            # unfiltered edges; bin the valid ones over their own range.
+            edges = data.trip_query.histogram_edges(selected_var, hour_range, filters, HISTOGRAM_BINS)
+            binned = None if edges is None else data.trip_query.histogram(selected_var, hour_range, filters, edges)
+        elif selected_var in histogram_rollup.edges:
+            # Same bin edges as the unfiltered histogram, counted in the query
+            binned = data.trip_query.histogram(selected_var, hour_range, filters,
+                                               histogram_rollup.edges[selected_var])
+        else:
+            binned = None
+        if binned is None:
+            return go.Figure(), "No data available for the selected range."
+        edges, counts = binned
+        centers = (edges[:-1] + edges[1:]) / 2
+        bin_ranges = np.column_stack([edges[:-1], edges[1:]])
+        hovertemplate = '[%{customdata[0]:.4g}, %{customdata[1]:.4g}): %{' + \
+            ('y' if orientation == 'v' else 'x') + '}<extra></extra>'
         if orientation == 'v':
-            fig = px.histogram(filtered_df, x=selected_var, nbins=30, color_discrete_sequence=['#2ecc71'])
+            fig = go.Figure(go.Bar(
+                x=centers,
+                y=counts,
+                width=np.diff(edges),
+                customdata=bin_ranges,
+                hovertemplate=hovertemplate,
+                marker_color='#2ecc71'
+            ))
+            fig.update_layout(xaxis_title=selected_var, yaxis_title='count')
         else:
-            fig = px.histogram(filtered_df, y=selected_var, nbins=30, color_discrete_sequence=['#2ecc71'])
-        description = f"This histogram displays the distribution of '{selected_var}' over 30 equi-width bins."
+            fig = go.Figure(go.Bar(
+                y=centers,
+                x=counts,
+                width=np.diff(edges),
+                orientation='h',
+                customdata=bin_ranges,
+                hovertemplate=hovertemplate,
+                marker_color='#2ecc71'
+            ))
+            fig.update_layout(xaxis_title='count', yaxis_title=selected_var)
+        fig.update_layout(bargap=0)
+        description = f"This histogram displays the distribution of '{selected_var}' over {len(counts)} equi-width bins."
     
     # Set chart template based on theme
     if theme == 'dark':
@@ -434,23 +1023,17 @@ def update_single_variable_chart(selected_var, orientation, hour_range, theme):
 
 
 
-@app.callback(
-    Output('scatter-plot', 'figure'),
-    [
-        Input('var-a-selector', 'value'),
-        Input('var-b-selector', 'value'),
-        Input('axis-assignment', 'value'),
-        Input('hour-slider', 'value'),
-        Input('theme-toggle', 'value')
-    ]
-)
-def update_scatter_plot(var_a, var_b, axis_assignment, hour_range, theme):
+@memoize_callback
+def scatter_figure(var_a, var_b, axis_assignment, hour_range, filters, theme, max_points):
     """
-    Creates a scatter plot with color-coded PRCP and a trendline.
-    Users choose which variable is on the x-axis vs y-axis.
+    WebGL scatter plot with color-coded PRCP and an OLS trendline, drawing at
+    most ``max_points`` trips of the hour range; the trendline is fitted from
+    the per-hour sufficient statistics over every trip in the range, or by the
+    query layer over the filtered trips.
     """
-    filtered_df = df[(df['pickup_hour'] >= hour_range[0]) & (df['pickup_hour'] <= hour_range[1])]
-    if var_a is None or var_b is None or filtered_df.empty:
+    data = dataset
+    h0, h1 = hour_range
+    if var_a is None or var_b is None or data.trips.range_size(h0, h1) == 0:
         return go.Figure()
     
     if axis_assignment == 'x':
@@ -458,16 +1041,57 @@ def update_scatter_plot(var_a, var_b, axis_assignment, hour_range, theme):
     else:
         x_var, y_var = var_b, var_a
     
-    fig = px.scatter(
-        filtered_df, 
-        x=x_var, 
-        y=y_var, 
-        color='PRCP',
-        opacity=0.7,
-        trendline="ols",
-        trendline_color_override="red",
-        color_continuous_scale=px.colors.sequential.Viridis,
-        hover_data={x_var: True, y_var: True, 'PRCP': True}
+    if filters_active(filters):
+        total_points, (x_values, y_values, prcp_values) = data.trip_query.sample(
+            [x_var, y_var, 'PRCP'], hour_range, filters, max_points)
+        if total_points == 0:
+            return go.Figure()
+        fit = data.trip_query.fit(x_var, y_var, hour_range, filters)
+    else:
+        # Sample row positions first and decode only those rows of the three
+        # columns: frame-level take/sample would copy the whole (possibly
+        # memory-mapped) table into private blocks.
+        total_points = data.trips.range_size(h0, h1)
+        sample = None
+        if total_points > max_points:
+            sample = np.sort(np.random.default_rng(0).choice(total_points, max_points, replace=False))
+        x_values = data.trips.range_values(h0, h1, x_var, data.weather, rows=sample)
+        y_values = data.trips.range_values(h0, h1, y_var, data.weather, rows=sample)
+        prcp_values = data.trips.range_values(h0, h1, 'PRCP', data.weather, rows=sample)
+        fit = data.regression_stats.range_fit(x_var, y_var, h0, h1)
+    
+    fig = go.Figure(go.Scattergl(
+        x=x_values,
+        y=y_values,
+        mode='markers',
+        name='trips',
+        marker=dict(color=prcp_values, coloraxis='coloraxis', opacity=0.7),
+        customdata=prcp_values,
+        hovertemplate=f'{x_var}=%{{x}}<br>{y_var}=%{{y}}<br>PRCP=%{{customdata}}<extra></extra>'
+    ))
+    
+    if fit is not None:
+        x_line = np.array(fit['x_range'])
+        fig.add_trace(go.Scattergl(
+            x=x_line,
+            y=fit['intercept'] + fit['slope'] * x_line,
+            mode='lines',
+            name='OLS trendline',
+            line=dict(color='red'),
+            hovertemplate=(
+                f"<b>OLS trendline</b><br>{y_var} = {fit['slope']:.6g} * {x_var} + {fit['intercept']:.6g}"
+                f"<br>R<sup>2</sup>={fit['r2']:.6f}<extra></extra>"
+            )
+        ))
+    
+    title = f'Relationship between {x_var} and {y_var}'
+    if total_points > max_points:
+        title += f' ({max_points:,} of {total_points:,} trips shown)'
+    fig.update_layout(
+        xaxis_title=x_var,
+        yaxis_title=y_var,
+        showlegend=False,
+        coloraxis=dict(colorscale='Viridis')
     )
     
     # Update layout for theme
@@ -477,7 +1101,7 @@ def update_scatter_plot(var_a, var_b, axis_assignment, hour_range, theme):
         fig.update_layout(template='plotly_white')
     
     fig.update_layout(
-        title=f'Relationship between {x_var} and {y_var}',
+        title=title,
         margin=dict(l=40, r=40, t=40, b=40),
         coloraxis_colorbar=dict(title="Precipitation (PRCP)")
     )
@@ -485,35 +1109,107 @@ def update_scatter_plot(var_a, var_b, axis_assignment, hour_range, theme):
 
 
 @app.callback(
-    Output('timeseries-chart', 'figure'),
+    Output('scatter-plot', 'figure'),
     [
-        Input('timeseries-metric', 'value'),
-        Input('theme-toggle', 'value')
-    ]
+        Input('var-a-selector', 'value'),
+        Input('var-b-selector', 'value'),
+        Input('axis-assignment', 'value'),
+        Input('hour-slider', 'value'),
+        Input('filters', 'data')
+    ],
+    [State('theme-toggle', 'value')],
+    background=True,
+    progress=[Output('scatter-plot', 'figure')],
+    cancel=[Input('hour-slider', 'value'), Input('filters', 'data')],
+    interval=BACKGROUND_POLL_INTERVAL
 )
-def update_timeseries(metric, theme):
+@instrument_callback
+@dataset_loader.requires_dataset
+def update_scatter_plot(set_progress, var_a, var_b, axis_assignment, hour_range, filters, theme):
+    """
+    Renders the Relationship scatter as a background job. Unless the
+    full-resolution figure is already stored, a sampled preview of
+    SCATTER_PREVIEW_POINTS trips is shown first (as job progress) and then
+    replaced by the SCATTER_MAX_POINTS figure. Moving the hour slider or
+    changing a filter cancels a job still running.
+    """
+    for var in (var_a, var_b):
+        if var is not None:
+            require_choice(var, numerical_columns)
+    args = (var_a, var_b, axis_assignment, hour_range, filters, theme)
+    if (scatter_figure.peek(*args, SCATTER_MAX_POINTS) is None
+            and dataset.trips.range_size(hour_range[0], hour_range[1]) > SCATTER_PREVIEW_POINTS):
+        set_progress(scatter_figure(*args, SCATTER_PREVIEW_POINTS))
+    return scatter_figure(*args, SCATTER_MAX_POINTS)
+
+
+def timeseries_window(relayout):
+    """
+    The x-axis window ``[start, end]`` (epoch hours) a relayout event of the
+    time-series chart zoomed or panned to; None for the full range, and False
+    for events that leave the x axis alone (resizes, y-axis zooms).
+    """
+    if not relayout or relayout.get('xaxis.autorange'):
+        return None
+    bounds = relayout.get('xaxis.range') or [relayout.get('xaxis.range[0]'), relayout.get('xaxis.range[1]')]
+    if bounds[0] is None or bounds[1] is None:
+        return False
+    start, end = (pd.Timestamp(bound).value / 3.6e12 for bound in bounds)
+    return [start, end]
+
+
+def timeseries_tile(start, end):
     """
-    Plots a line chart of the chosen metric (Total Trips, Average Fare, or Average Distance)
-    grouped by pickup_date.
+    ``(level, start, end)``: the finest pyramid level that keeps the x-axis
+    window ``[start, end]`` (epoch hours) within TIMESERIES_MAX_POINTS buckets,
+    and the range of data to draw for it. The range lies on a grid whose step
+    is the window span rounded up to a power-of-two number of buckets, and
+    leaves at least one step on either side of the window for panning, so the
+    pans and zooms of a session share a few memoized figures instead of one
+    per relayout event.
     """
-    # Group by pickup_date
-    df_daily = df.groupby('pickup_date').agg({
-        'fare_amount': 'mean',
-        'trip_distance': 'mean',
-        'tpep_pickup_datetime': 'count'
-    }).rename(columns={'tpep_pickup_datetime': 'trips'}).reset_index()
+    level = time_level(start, end, TIMESERIES_MAX_POINTS)
+    bucket = TIME_LEVELS[level]
+    step = bucket * 2 ** int(np.ceil(np.log2(max((end - start) / bucket, 1))))
+    origin = int(np.floor(start / step)) * step
+    return level, origin - step, origin + 3 * step
+
+
+@memoize_callback
+def timeseries_figure(metric, filters, tile, theme):
+    """
+    Line chart of the chosen metric (Total Trips, Average Fare, or Average
+    Distance) over ``tile`` (``timeseries_tile`` of the zoomed window, None
+    for all data at the level fitting the whole extent); read from the
+    precomputed pyramid or, with filters set, grouped by the query layer.
+    """
+    import plotly.express as px
+
+    data = dataset
+    extent = data.timeseries_pyramid.extent()
+    if extent is None:
+        return go.Figure()
+    if tile is None:
+        start, end = extent
+        level = time_level(start, end, TIMESERIES_MAX_POINTS)
+    else:
+        level, start, end = tile
+    if filters_active(filters):
+        df_series = data.trip_query.timeseries(level, filters, start, end)
+    else:
+        df_series = data.timeseries_pyramid.frame(level, start, end)
     
     # Choose the appropriate metric
     if metric == 'trips':
-        fig = px.line(df_daily, x='pickup_date', y='trips', markers=True,
+        fig = px.line(df_series, x='pickup_time', y='trips', markers=True,
                       color_discrete_sequence=['#e74c3c'])
         y_title = "Total Trips"
     elif metric == 'fare':
-        fig = px.line(df_daily, x='pickup_date', y='fare_amount', markers=True,
+        fig = px.line(df_series, x='pickup_time', y='fare_amount', markers=True,
                       color_discrete_sequence=['#27ae60'])
         y_title = "Average Fare ($)"
     else:  # metric == 'distance'
-        fig = px.line(df_daily, x='pickup_date', y='trip_distance', markers=True,
+        fig = px.line(df_series, x='pickup_time', y='trip_distance', markers=True,
                       color_discrete_sequence=['#2980b9'])
         y_title = "Average Trip Distance (mi)"
     
@@ -524,7 +1220,7 @@ def update_timeseries(metric, theme):
         fig.update_layout(template='plotly_white')
     
     fig.update_layout(
-        title=f"{y_title} Over Time",
+        title=f"{y_title} Over Time ({LEVEL_LABELS[level]})",
         xaxis_title="Date",
         yaxis_title=y_title,
         margin=dict(l=40, r=40, t=40, b=40)
@@ -532,6 +1228,85 @@ def update_timeseries(metric, theme):
     return fig
 
 
+@app.callback(
+    Output('timeseries-chart', 'figure'),
+    [
+        Input('timeseries-metric', 'value'),
+        Input('filters', 'data'),
+        Input('timeseries-chart', 'relayoutData')
+    ],
+    [State('theme-toggle', 'value')]
+)
+@instrument_callback
+@dataset_loader.requires_dataset
+def update_timeseries(metric, filters, relayout, theme):
+    """
+    Redraws the time series when the metric or filters change and when the
+    chart is zoomed or panned, at the level of detail of the new window.
+    """
+    window = timeseries_window(relayout)
+    if window is False:
+        if callback_context.triggered[0]['prop_id'] == 'timeseries-chart.relayoutData':
+            raise PreventUpdate
+        window = None
+    if window is None:
+        return timeseries_figure(metric, filters, None, theme)
+    fig = timeseries_figure(metric, filters, timeseries_tile(*window), theme)
+    # Keep the exact zoomed view; the rest of the tile is there for panning.
+    fig.update_xaxes(range=[pd.Timestamp(bound * 3.6e12) for bound in window])
+    return fig
+
+
+@app.callback(
+    Output('density-map', 'figure'),
+    [
+        Input('map-location', 'value'),
+        Input('map-metric', 'value'),
+        Input('hour-slider', 'value'),
+        Input('filters', 'data')
+    ],
+    [State('theme-toggle', 'value')]
+)
+@instrument_callback
+@dataset_loader.requires_dataset
+@memoize_callback
+def update_density_map(location, metric, hour_range, filters, theme):
+    """
+    Draws a density map of pickups or dropoffs from the per-cell rollup (or
+    the query layer, with filters set), one weighted point per occupied grid
+    cell, weighted by trips or fare total.
+    """
+    require_choice(location, MAP_LOCATIONS)
+    data = dataset
+    if filters_active(filters):
+        cells, trip_counts, fare_sums, avg_fares = data.trip_query.grid_cells(f'{location}_cell', hour_range,
+                                                                              filters)
+    else:
+        cells, trip_counts, fare_sums, avg_fares = data.grid_rollups[location].range_cells(hour_range[0],
+                                                                                           hour_range[1])
+    longitude, latitude = cell_centers(cells)
+    weights = trip_counts if metric == 'trips' else fare_sums
+
+    fig = go.Figure(go.Densitymapbox(
+        lon=longitude,
+        lat=latitude,
+        z=weights,
+        radius=12,
+        colorscale='Inferno',
+        customdata=np.column_stack([trip_counts, avg_fares]),
+        hovertemplate='trips: %{customdata[0]}<br>avg fare: $%{customdata[1]:.2f}<extra></extra>',
+        colorbar=dict(title='Trips' if metric == 'trips' else 'Total fare ($)')
+    ))
+    fig.update_layout(
+        template=FIGURE_TEMPLATES[theme],
+        mapbox=dict(style=MAPBOX_STYLES[theme], center=dict(lat=40.75, lon=-73.97), zoom=10),
+        title=f"{'Pickup' if location == 'pickup' else 'Dropoff'} density "
+              f"({int(trip_counts.sum()):,} trips, hours {hour_range[0]}-{hour_range[1]})",
+        margin=dict(l=10, r=10, t=40, b=10)
+    )
+    return fig
+
+
 
 app.index_string = '''
 <!DOCTYPE html>
@@ -573,5 +1348,12 @@ app.index_string = '''
 </html>
 '''
 
+# Load the dataset now, or in a background thread with TAXI_BACKGROUND_LOAD=1.
+dataset_loader.start(background=BACKGROUND_LOAD)
+dataset_loader.mark('app_imported')
+
 if __name__ == '__main__':
+    # Fetch the page once the server is up so time to first byte is logged at startup.
+    threading.Thread(target=probe_first_byte, daemon=True,
+                     args=(f"http://127.0.0.1:{os.environ.get('PORT', '8050')}/",)).start()
     app.run_server()
\ No newline at end of file
@@ -0,0 +1,253 @@
+"""
+Latency, memory and payload benchmark of the dashboard callbacks.
+
+For every requested size a synthetic dataset (``synthetic.py``) is written once
+under ``<TAXI_CACHE_DIR>/bench`` and loaded by a fresh interpreter, since
+``app`` loads its dataset at import time. That process calls each callback
+function directly, bypassing the memoization store so every call computes its
+output, over a fixed, seeded set of inputs, and reports:
+
+- latency percentiles (p50/p90/p99/max) over ``--repeat`` rounds,
+- peak Python/NumPy allocation of a call (``tracemalloc``, measured in a
+  separate pass so tracing does not skew the timings),
+- the size of the JSON Dash would send for the output.
+
+    python benchmark.py --rows 10k 100k 1M --json bench.json
+    python benchmark.py --data merged_data.csv
+"""
+import argparse
+import inspect
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from ingest import CACHE_DIR
+from query import PRECIPITATION_BUCKETS
+from synthetic import parse_count, write_csv
+
+
+# update_scatter_plot is a background callback; its figure is timed through
+# scatter_figure, which renders it in the job process. update_timeseries only
+# turns the chart's relayout event into the window of timeseries_figure.
+CALLBACKS = ['update_metrics', 'update_quantiles', 'update_single_variable_chart', 'scatter_figure',
+             'timeseries_figure', 'update_density_map']
+PERCENTILES = [50, 90, 99]
+
+
+def callback_inputs(app, count, seed=0):
+    """
+    ``count`` argument tuples per callback, drawn from the values the layout
+    controls can take.
+    """
+    rng = random.Random(seed)
+    variables = app.categorical_columns + app.numerical_columns
+
+    def hour_range():
+        start = rng.randrange(24)
+        return [start, rng.randrange(start, 24)]
+
+    def theme():
+        return rng.choice(['light', 'dark'])
+
+    days = [str(day)[:10] for day in app.dataset.timeseries_pyramid.frame('day')['pickup_time']]
+
+    def filters():
+        # Half of the calls set only the hour range (rollups), the others a
+        # random combination of the dashboard filters (query layer).
+        chosen = dict(app.DEFAULT_FILTERS)
+        if rng.random() < 0.5:
+            return chosen
+        if days and rng.random() < 0.5:
+            start = rng.randrange(len(days))
+            chosen['start_date'], chosen['end_date'] = days[start], days[rng.randrange(start, len(days))]
+        for col, codes in [('payment_type', app.PAYMENT_TYPES), ('VendorID', app.VENDORS),
+                           ('RatecodeID', app.RATECODES)]:
+            if rng.random() < 0.5:
+                chosen[col] = sorted(rng.sample(sorted(codes), rng.randint(1, 2)))
+        if rng.random() < 0.5:
+            chosen['precipitation'] = sorted(rng.sample(PRECIPITATION_BUCKETS, 2))
+        if rng.random() < 0.5:
+            chosen['valid_only'] = True
+        return chosen
+
+    extent = app.dataset.timeseries_pyramid.extent()
+
+    def tile():
+        # Full range or the tile of a zoom window of a few hours to the whole
+        # extent.
+        if extent is None or rng.random() < 0.5:
+            return None
+        span = rng.uniform(6, extent[1] - extent[0])
+        start = rng.uniform(extent[0], extent[1] - span)
+        return app.timeseries_tile(start, start + span)
+
+    return {
+        'update_metrics': [(hour_range(), filters()) for _ in range(count)],
+        'update_quantiles': [(rng.choice(app.numerical_columns), hour_range(), filters()) for _ in range(count)],
+        'update_single_variable_chart': [
+            (rng.choice(variables), rng.choice(['v', 'h']), hour_range(), filters(), theme()) for _ in range(count)],
+        'scatter_figure': [
+            (rng.choice(app.numerical_columns), rng.choice(app.numerical_columns), rng.choice(['x', 'y']),
+             hour_range(), filters(), theme(), app.SCATTER_MAX_POINTS) for _ in range(count)],
+        'timeseries_figure': [
+            (rng.choice(['trips', 'fare', 'distance']), filters(), tile(), theme()) for _ in range(count)],
+        'update_density_map': [
+            (rng.choice(['pickup', 'dropoff']), rng.choice(['trips', 'fare']), hour_range(), filters(), theme())
+            for _ in range(count)],
+    }
+
+
+def payload_bytes(output):
+    """
+    Size of the JSON response body Dash would send for a callback output.
+    """
+    from plotly.utils import PlotlyJSONEncoder
+
+    return len(json.dumps(output, cls=PlotlyJSONEncoder).encode())
+
+
+def _summary(values):
+    values = np.asarray(values, dtype='float64')
+    summary = {f'p{q}': float(np.percentile(values, q)) for q in PERCENTILES}
+    summary['max'] = float(values.max())
+    return summary
+
+
+def measure_callback(func, inputs, repeat):
+    """
+    Times ``func`` over ``inputs`` ``repeat`` times, then traces one pass for
+    the peak allocation of a single call.
+    """
+    func(*inputs[0])
+    latencies, payloads = [], []
+    for _ in range(repeat):
+        for args in inputs:
+            start = time.perf_counter()
+            output = func(*args)
+            latencies.append((time.perf_counter() - start) * 1000)
+            payloads.append(payload_bytes(output))
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for args in inputs:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            func(*args)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'calls': len(latencies),
+        'latency_ms': _summary(latencies),
+        'peak_alloc_bytes': int(max(peaks)),
+        'payload_bytes': _summary(payloads),
+    }
+
+
+def run_worker(inputs_per_callback, repeat, seed):
+    """
+    Benchmarks the dataset named by ``TAXI_DATA_PATH`` in this process.
+    """
+    from memory_report import process_memory
+
+    start = time.perf_counter()
+    import app
+    app.dataset_loader.wait()
+    load_seconds = time.perf_counter() - start
+    memory = process_memory()
+
+    inputs = callback_inputs(app, inputs_per_callback, seed)
+    results = {
+        'data_path': app.DATA_PATH,
+        'rows': len(app.dataset.trips),
+        'load_seconds': load_seconds,
+        'rss_after_load_bytes': memory.get('rss'),
+        'callbacks': {},
+    }
+    for name in CALLBACKS:
+        # functools.wraps exposes the undecorated callback, skipping the
+        # instrumentation and the memoization store.
+        func = inspect.unwrap(getattr(app, name))
+        results['callbacks'][name] = measure_callback(func, inputs[name], repeat)
+    return results
+
+
+def dataset_for(rows, seed):
+    directory = os.path.join(CACHE_DIR, 'bench')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'synthetic-{rows}-s{seed}.csv')
+    if not os.path.exists(path):
+        tmp_path = f'{path}.tmp'
+        write_csv(tmp_path, rows, seed=seed)
+        os.replace(tmp_path, path)
+    return path
+
+
+def run_dataset(data_path, args):
+    """
+    Runs the worker for ``data_path`` in a fresh interpreter, with a private
+    figure cache directory, and returns its results.
+    """
+    with tempfile.TemporaryDirectory() as figure_cache:
+        env = dict(os.environ, TAXI_DATA_PATH=os.path.abspath(data_path),
+                   TAXI_FIGURE_CACHE_DIR=figure_cache, TAXI_LOG_LEVEL='WARNING')
+        command = [sys.executable, os.path.abspath(__file__), '--worker',
+                   '--inputs', str(args.inputs), '--repeat', str(args.repeat), '--seed', str(args.seed)]
+        completed = subprocess.run(command, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   check=True, stdout=subprocess.PIPE, text=True)
+    return json.loads(completed.stdout)
+
+
+def format_results(results):
+    mib = 1024 * 1024
+    header = f"{results['data_path']}: {results['rows']} rows, loaded in {results['load_seconds']:.2f}s"
+    if results['rss_after_load_bytes']:
+        header += f", rss {results['rss_after_load_bytes'] / mib:.1f}MiB"
+    lines = [
+        header,
+        f"  {'callback':<30} {'calls':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} "
+        f"{'peak MiB':>9} {'p50 KiB':>9} {'max KiB':>9}",
+    ]
+    for name, stats in results['callbacks'].items():
+        latency, payload = stats['latency_ms'], stats['payload_bytes']
+        lines.append(
+            f"  {name:<30} {stats['calls']:>6} {latency['p50']:>9.2f} {latency['p90']:>9.2f} "
+            f"{latency['p99']:>9.2f} {latency['max']:>9.2f} {stats['peak_alloc_bytes'] / mib:>9.2f} "
+            f"{payload['p50'] / 1024:>9.2f} {payload['max'] / 1024:>9.2f}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard callbacks.')
+    parser.add_argument('--rows', nargs='+', default=['10k', '100k'],
+                        help='synthetic dataset sizes, e.g. 10k 1M 100M')
+    parser.add_argument('--data', nargs='+', help='benchmark these datasets instead of synthetic ones')
+    parser.add_argument('--inputs', type=int, default=20, help='distinct inputs per callback')
+    parser.add_argument('--repeat', type=int, default=5, help='timed rounds over the inputs')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        json.dump(run_worker(args.inputs, args.repeat, args.seed), sys.stdout)
+        sys.exit(0)
+
+    paths = args.data or [dataset_for(parse_count(rows), args.seed) for rows in args.rows]
+    all_results = []
+    for path in paths:
+        results = run_dataset(path, args)
+        print(format_results(results), flush=True)
+        all_results.append(results)
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(all_results, fh, indent=2)
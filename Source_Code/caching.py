@@ -0,0 +1,174 @@
+"""
+Memoization of callback outputs.
+
+Every figure callback is a pure function of its inputs and the loaded dataset,
+so outputs are memoized in a Flask-Caching filesystem store under the ingest
+cache directory. Workers on the same host share one store, so a figure built by
+one gunicorn worker is a hit for all of them. Entries expire after a TTL and
+the store is capped at a fixed number of entries.
+
+Cache keys include the dataset version (source hash + cache schema) and a
+digest of the callback's source, so a new dataset or a redeploy never serves
+stale figures.
+
+Background callbacks exchange their job progress and results through a
+separate diskcache store beside it (``background_callback_manager``). A job
+also leaves its callback's duration and cache hits/misses there, which the
+serving process records in ``/metrics`` when it collects the result.
+"""
+import functools
+import hashlib
+import inspect
+import os
+import threading
+import time
+
+import flask
+from dash import DiskcacheManager
+from flask_caching import Cache
+
+from ingest import CACHE_DIR
+from metrics import CACHE_REQUESTS, CALLBACK_DURATION
+
+
+CACHE_CONFIG = {
+    'CACHE_TYPE': 'FileSystemCache',
+    'CACHE_DIR': os.environ.get('TAXI_FIGURE_CACHE_DIR', os.path.join(CACHE_DIR, 'figures')),
+    'CACHE_THRESHOLD': int(os.environ.get('TAXI_FIGURE_CACHE_SIZE', '1000')),
+    'CACHE_DEFAULT_TIMEOUT': int(os.environ.get('TAXI_FIGURE_CACHE_TTL', str(24 * 3600))),
+}
+
+cache = Cache(config=CACHE_CONFIG)
+
+# Progress and results of running background callback jobs.
+JOB_STORE_DIR = os.environ.get('TAXI_JOB_STORE_DIR', os.path.join(CACHE_DIR, 'jobs'))
+
+# Lifetime (s) of the metrics a job recorded when its result is never
+# collected, e.g. a job cancelled after it finished.
+JOB_METRICS_TTL = 3600
+
+_dataset_version = None
+
+# Set by a memoized function's body, i.e. only when the store missed.
+_lookup = threading.local()
+
+
+def init_cache(server, dataset_version):
+    """
+    Binds the store to the Flask server behind the Dash app. The server is
+    also kept as the default app, as ``Cache(server)`` would, so memoized
+    callbacks can be called outside a request (e.g. from a benchmark).
+    """
+    cache.app = server
+    cache.init_app(server)
+    set_dataset_version(dataset_version)
+
+
+def set_dataset_version(version):
+    """
+    Switches the version baked into every cache key; entries of the previous
+    version simply stop being hit and age out.
+    """
+    global _dataset_version
+    _dataset_version = version
+
+
+def memoize_callback(func):
+    """
+    Decorator memoizing a callback on its positional inputs and the current
+    dataset version; every lookup is counted as a hit or miss.
+    """
+    source_digest = hashlib.sha256(inspect.getsource(func).encode()).hexdigest()[:12]
+
+    def cached(dataset_version, *args):
+        _lookup.missed = True
+        return func(*args)
+
+    # Flask-Caching names entries after the function; give each callback its
+    # own namespace that also changes whenever its code does.
+    cached.__module__ = func.__module__
+    cached.__qualname__ = f'{func.__qualname__}.{source_digest}'
+    cached = cache.memoize()(cached)
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        _lookup.missed = False
+        result = cached(_dataset_version, *args)
+        CACHE_REQUESTS.inc(func.__name__, 'miss' if _lookup.missed else 'hit')
+        return result
+
+    def peek(*args):
+        """
+        The stored output for ``args``, or None; never computes it.
+        """
+        return cache.get(cached.make_cache_key(cached.uncached, _dataset_version, *args))
+
+    wrapper.peek = peek
+    return wrapper
+
+
+class TimedDiskcacheManager(DiskcacheManager):
+    """
+    ``DiskcacheManager`` whose jobs report how long their callback ran and
+    the memoized lookups it made. The job process stores the callback's name,
+    duration and ``CACHE_REQUESTS`` increments next to its result (before it,
+    since collecting the result ends the job), and the serving process records
+    them in ``CALLBACK_DURATION`` and ``CACHE_REQUESTS`` when it collects the
+    result, where they would otherwise be lost with the job process.
+    """
+
+    def make_job_fn(self, fn, progress, key=None):
+        handle = self.handle
+        # Set in the job process, which runs exactly one job.
+        job = {}
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            lookups = CACHE_REQUESTS.snapshot()
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                added = {labels: count - lookups.get(labels, 0)
+                         for labels, count in CACHE_REQUESTS.snapshot().items() if count != lookups.get(labels, 0)}
+                handle.set(_metrics_key(job['result_key']), (fn.__name__, duration, added),
+                           expire=JOB_METRICS_TTL)
+
+        job_fn = super().make_job_fn(timed, progress, key)
+
+        def keyed_job_fn(result_key, progress_key, user_callback_args, context):
+            job['result_key'] = result_key
+            return job_fn(result_key, progress_key, user_callback_args, context)
+
+        return keyed_job_fn
+
+    def get_result(self, key, job):
+        result = super().get_result(key, job)
+        if result is not self.UNDEFINED:
+            recorded = self.handle.pop(_metrics_key(key), None)
+            if recorded is not None:
+                name, duration, lookups = recorded
+                CALLBACK_DURATION.observe(duration, name)
+                for labels, count in lookups.items():
+                    CACHE_REQUESTS.inc(*labels, amount=count)
+                if flask.has_request_context():
+                    # Attributes this response's size to the callback.
+                    flask.g.taxi_callback = name
+        return result
+
+
+def _metrics_key(result_key):
+    return f'{result_key}-metrics'
+
+
+def background_callback_manager():
+    """
+    Job manager of the background callbacks: each job runs in a forked
+    process (sharing the loaded dataset copy-on-write) and hands its progress,
+    result and metrics back through a diskcache store under the cache
+    directory, so no broker is needed.
+    """
+    import diskcache
+
+    return TimedDiskcacheManager(diskcache.Cache(JOB_STORE_DIR))
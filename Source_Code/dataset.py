@@ -0,0 +1,102 @@
+"""
+Row-level access to the trip table for the callbacks that still need rows.
+
+The table is kept sorted by ``pickup_hour`` with per-hour offset boundaries, so
+the trips of any hour range are one contiguous ``iloc`` slice: a view over the
+existing columns rather than a boolean mask and a copy. Slices are memoized in
+a small LRU cache keyed by hour range and shared by every callback.
+
+Trips appended after the load (``append``) are kept as further hour-sorted
+segments instead of re-sorting the whole table. A segment is merged into the
+one before it once it reaches half that one's size, so there are at most about
+log2(rows) segments and every row is copied O(log rows) times over any number
+of appends.
+"""
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregates import HOURS
+from schema import column_values, conform_frame
+
+
+SLICE_CACHE_SIZE = int(os.environ.get('TAXI_SLICE_CACHE_SIZE', '64'))
+
+
+def sort_by_hour(df):
+    """
+    Stable sort on ``pickup_hour``; a no-op when the table is already sorted.
+    """
+    if df['pickup_hour'].is_monotonic_increasing:
+        return df
+    return df.sort_values('pickup_hour', kind='stable', ignore_index=True)
+
+
+def _hour_bounds(df):
+    return np.searchsorted(df['pickup_hour'].to_numpy(), np.arange(HOURS + 1))
+
+
+class HourIndexedTrips:
+    """
+    Trip table sorted by pickup hour, with ``bounds[h]:bounds[h + 1]`` the rows
+    of hour ``h``; ``df`` and ``bounds`` describe the first segment and
+    ``segments`` holds every ``(frame, bounds)`` pair.
+    """
+
+    def __init__(self, df, segments=None):
+        if segments is None:
+            df = sort_by_hour(df)
+            segments = [(df, _hour_bounds(df))]
+        self.segments = segments
+        self.df, self.bounds = segments[0]
+        self.hour_slice = functools.lru_cache(maxsize=SLICE_CACHE_SIZE)(self._hour_slice)
+
+    def __len__(self):
+        return sum(len(frame) for frame, _ in self.segments)
+
+    @property
+    def frames(self):
+        return [frame for frame, _ in self.segments]
+
+    def _hour_slice(self, h0, h1):
+        if len(self.segments) == 1:
+            return self.df.iloc[self.bounds[h0]:self.bounds[h1 + 1]]
+        return pd.concat([frame.iloc[bounds[h0]:bounds[h1 + 1]] for frame, bounds in self.segments],
+                         ignore_index=True)
+
+    def range_size(self, h0, h1):
+        return int(sum(bounds[h1 + 1] - bounds[h0] for _, bounds in self.segments))
+
+    def range_values(self, h0, h1, col, weather=None, rows=None):
+        """
+        ``column_values`` of the hour range's trips, in ``hour_slice`` order;
+        ``rows`` (sorted positions within the range) restricts the read
+        without concatenating the segments.
+        """
+        if len(self.segments) == 1:
+            return column_values(self.hour_slice(h0, h1), col, weather, rows=rows)
+        parts, start = [], 0
+        for frame, bounds in self.segments:
+            piece = frame.iloc[bounds[h0]:bounds[h1 + 1]]
+            if rows is None:
+                parts.append(column_values(piece, col, weather))
+            else:
+                lo, hi = np.searchsorted(rows, [start, start + len(piece)])
+                parts.append(column_values(piece, col, weather, rows=rows[lo:hi] - start))
+            start += len(piece)
+        return np.concatenate(parts)
+
+    def append(self, new_trips):
+        """
+        New ``HourIndexedTrips`` that also holds ``new_trips`` (converted to
+        this table's dtypes); this one is left unchanged.
+        """
+        segments = list(self.segments)
+        frame = sort_by_hour(conform_frame(new_trips, self.df))
+        while len(segments) > 1 and len(segments[-1][0]) <= 2 * len(frame):
+            frame = sort_by_hour(pd.concat([segments.pop()[0], frame], ignore_index=True))
+        if len(segments) == 1 and len(segments[0][0]) <= 2 * len(frame):
+            return HourIndexedTrips(pd.concat([segments[0][0], frame], ignore_index=True))
+        return HourIndexedTrips(self.df, segments + [(frame, _hour_bounds(frame))])
@@ -0,0 +1,153 @@
+"""
+Download of the trips behind the current dashboard filters.
+
+``init_export`` serves ``/export.csv`` and ``/export.parquet``. Both take the
+dashboard filters as query parameters, the same ones the charts use::
+
+    /export.csv?hours=7-9&start_date=2016-01-01&end_date=2016-01-31
+        &payment_type=1,2&VendorID=2&RatecodeID=1&precipitation=light,heavy&valid_only=1
+
+Rows are streamed straight from the query layer (``TripQuery.export_reader``)
+in batches of ``TAXI_EXPORT_BATCH_ROWS``: each batch is written as a chunk of
+CSV or as one Parquet row group and sent before the next one is read, so an
+export of millions of rows holds one batch in memory, never the filtered frame
+or the whole file.
+"""
+import os
+
+import flask
+import pandas as pd
+
+from query import CODE_FILTERS, PRECIPITATION_BUCKETS
+
+
+EXPORT_BATCH_ROWS = int(os.environ.get('TAXI_EXPORT_BATCH_ROWS', '65536'))
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class _ChunkSink:
+    """
+    Write-only file object collecting what a writer produced since the last
+    ``drain``.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parse_export_args(args):
+    """
+    ``(hour_range, filters)`` from the query parameters of an export URL;
+    raises ValueError on malformed values.
+    """
+    first, _, last = args.get('hours', '0-23').partition('-')
+    hour_range = [int(first), int(last or first)]
+    if not 0 <= hour_range[0] <= hour_range[1] <= 23:
+        raise ValueError(f'invalid hour range {args.get("hours")!r}')
+
+    def listed(name):
+        return [value for value in args.get(name, '').split(',') if value]
+
+    filters = {}
+    for name in ('start_date', 'end_date'):
+        value = args.get(name) or None
+        if value is not None:
+            try:
+                value = pd.Timestamp(value).strftime('%Y-%m-%d')
+            except (ValueError, OverflowError):
+                raise ValueError(f'invalid {name} {value!r}') from None
+        filters[name] = value
+    for col in CODE_FILTERS:
+        filters[col] = [int(value) for value in listed(col)]
+    filters['precipitation'] = listed('precipitation')
+    filters['valid_only'] = args.get('valid_only', '0') not in ('', '0')
+    unknown = set(filters['precipitation']) - set(PRECIPITATION_BUCKETS)
+    if unknown:
+        raise ValueError(f'unknown precipitation buckets {sorted(unknown)}')
+    return hour_range, filters
+
+
+def _csv_chunks(reader):
+    import pyarrow.csv as pacsv
+
+    sink = _ChunkSink()
+    with pacsv.CSVWriter(sink, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _parquet_chunks(reader):
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch, row_group_size=batch.num_rows)
+            yield sink.drain()
+    # The footer is written on close.
+    yield sink.drain()
+
+
+def stream_export(query, hour_range, filters, fmt, batch_rows=EXPORT_BATCH_ROWS):
+    """
+    Generator of the encoded export, one chunk per batch of rows.
+    """
+    reader = query.export_reader(hour_range, filters, batch_rows)
+    chunks = _csv_chunks(reader) if fmt == 'csv' else _parquet_chunks(reader)
+    for chunk in chunks:
+        if chunk:
+            yield chunk
+
+
+def init_export(server, current_query):
+    """
+    Serves ``/export.<format>``. ``current_query`` returns the loaded
+    ``TripQuery``, or None while the dataset is still loading.
+    """
+
+    @server.route('/export.<fmt>')
+    def export_endpoint(fmt):
+        if fmt not in EXPORT_FORMATS:
+            flask.abort(404)
+        try:
+            hour_range, filters = parse_export_args(flask.request.args)
+        except ValueError as exc:
+            return flask.Response(f'{exc}\n', status=400, mimetype='text/plain')
+        query = current_query()
+        if query is None:
+            return flask.Response('the dataset is still loading\n', status=503, mimetype='text/plain',
+                                  headers={'Retry-After': '5'})
+        return flask.Response(
+            flask.stream_with_context(stream_export(query, hour_range, filters, fmt)),
+            mimetype=EXPORT_FORMATS[fmt],
+            headers={'Content-Disposition': f'attachment; filename="trips.{fmt}"'})
+
+    return server
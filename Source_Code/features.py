@@ -0,0 +1,103 @@
+"""
+Derived trip features and data-quality flags, computed once at ingest.
+
+Every trip gets:
+
+- ``trip_duration``: minutes from pickup to dropoff (negative when the dropoff
+  is recorded before the pickup);
+- ``avg_speed``: ``trip_distance`` over the duration, in miles per hour;
+- ``tip_pct``: ``tip_amount`` as a percentage of ``fare_amount``;
+- ``quality_flags``: a ``uint8`` bit set of the checks below the trip fails,
+  0 for a valid trip.
+
+Features are rounded to hundredths, so ``schema.compact_frame`` stores them as
+``int32`` fixed point like the money columns. Where a feature is undefined (a
+missing timestamp, no positive duration, no positive fare) it is 0 and the trip
+is flagged, so
+``quality_flags == 0`` is the mask selecting the trips whose features are all
+meaningful.
+"""
+import numpy as np
+
+
+FEATURE_COLUMNS = ['trip_duration', 'avg_speed', 'tip_pct']
+FLAGS_COLUMN = 'quality_flags'
+FLAGS_DTYPE = 'uint8'
+
+# Bits of quality_flags.
+ZERO_DISTANCE = 1
+NEGATIVE_FARE = 2
+DROPOFF_BEFORE_PICKUP = 4
+ZERO_DURATION = 8
+LONG_DURATION = 16
+SPEED_OUTLIER = 32
+NO_POSITIVE_FARE = 64
+MISSING_TIME = 128
+
+FLAG_NAMES = {
+    ZERO_DISTANCE: 'zero distance',
+    NEGATIVE_FARE: 'negative fare or total',
+    DROPOFF_BEFORE_PICKUP: 'dropoff before pickup',
+    ZERO_DURATION: 'zero duration',
+    LONG_DURATION: 'longer than 12 hours',
+    SPEED_OUTLIER: 'faster than 100 mph',
+    NO_POSITIVE_FARE: 'no positive fare',
+    MISSING_TIME: 'missing pickup or dropoff time',
+}
+
+MAX_DURATION_MINUTES = 12 * 60
+MAX_SPEED_MPH = 100
+
+# Features are clipped to this magnitude so their hundredths fit an int32;
+# anything near it is flagged already.
+_FEATURE_LIMIT = 1e6
+
+
+def trip_features(pickup, dropoff, distance, fare, total, tip):
+    """
+    ``({feature column: float64 array}, flags)`` of the trips given as arrays
+    of pickup/dropoff datetime64 and decoded distance, fare, total and tip.
+    """
+    pickup = np.asarray(pickup, dtype='datetime64[ns]')
+    dropoff = np.asarray(dropoff, dtype='datetime64[ns]')
+    distance = np.asarray(distance, dtype='float64')
+    fare = np.asarray(fare, dtype='float64')
+    total = np.asarray(total, dtype='float64')
+    tip = np.asarray(tip, dtype='float64')
+
+    duration = (dropoff - pickup) / np.timedelta64(1, 'm')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        speed = np.where(duration > 0, distance / (duration / 60), 0.0)
+        tip_pct = np.where(fare > 0, 100 * tip / fare, 0.0)
+
+    flags = np.zeros(len(duration), dtype=FLAGS_DTYPE)
+    flags[~(distance > 0)] |= ZERO_DISTANCE
+    flags[(fare < 0) | (total < 0)] |= NEGATIVE_FARE
+    flags[duration < 0] |= DROPOFF_BEFORE_PICKUP
+    flags[duration == 0] |= ZERO_DURATION
+    flags[duration > MAX_DURATION_MINUTES] |= LONG_DURATION
+    flags[speed > MAX_SPEED_MPH] |= SPEED_OUTLIER
+    flags[~(fare > 0)] |= NO_POSITIVE_FARE
+    flags[np.isnat(pickup) | np.isnat(dropoff)] |= MISSING_TIME
+
+    features = {}
+    for col, values in zip(FEATURE_COLUMNS, (duration, speed, tip_pct)):
+        values = np.nan_to_num(values, nan=0.0, posinf=0.0, neginf=0.0)
+        features[col] = np.round(np.clip(values, -_FEATURE_LIMIT, _FEATURE_LIMIT), 2)
+    return features, flags
+
+
+def add_feature_columns(df):
+    """
+    Adds the feature columns and ``quality_flags`` to a trip frame whose
+    columns are not yet compacted.
+    """
+    features, flags = trip_features(
+        df['tpep_pickup_datetime'].to_numpy(), df['tpep_dropoff_datetime'].to_numpy(),
+        df['trip_distance'].to_numpy(), df['fare_amount'].to_numpy(), df['total_amount'].to_numpy(),
+        df['tip_amount'].to_numpy())
+    for col, values in features.items():
+        df[col] = values
+    df[FLAGS_COLUMN] = flags
+    return df
+
@@ -0,0 +1,678 @@
+"""
+Ingest stage for the dashboard dataset.
+
+Trips and weather are kept apart: the trip table holds only trip fields plus
+the derived ``pickup_hour``/``pickup_date``, grid cells (``spatial``) and trip
+features and quality flags (``features``), and daily weather is a
+``weather.WeatherTable`` joined onto trips by pickup date when read.
+
+The merged trip/weather CSV is parsed once with an explicit schema and a fixed
+datetime format, the derived columns are added, and the trip table and the
+daily weather it carries are written to Parquet caches. Later starts read the
+caches instead of re-parsing the CSV; they are invalidated when the source file
+changes (size/mtime, then SHA-256).
+
+For inputs larger than memory, ``build_dataset`` streams raw TLC trip CSVs in
+bounded-size batches into a month/day partitioned Parquet dataset and stores a
+NOAA daily weather file next to it as the weather dimension; ``load_trips`` and
+``load_weather`` also accept such a directory in place of a CSV:
+
+    python ingest.py yellow_tripdata_2016-*.csv --weather nyc_weather.csv --out data/trips
+
+Ingesting more files into an existing directory adds their partitions and
+merges their days into the weather file, which is how a running dashboard is
+refreshed (``refresh.py``).
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from dataset import sort_by_hour
+from features import FEATURE_COLUMNS, FLAGS_COLUMN, add_feature_columns, trip_features
+from schema import compact_frame, to_day_ordinals
+from spatial import CELL_COLUMNS, add_cell_columns, grid_cells
+from weather import WEATHER_COLUMNS, WEATHER_FILENAME, WeatherTable
+
+
+CACHE_DIR = os.environ.get('TAXI_CACHE_DIR', '.cache')
+
+# Bump whenever the cached table layout changes so stale caches are rebuilt.
+SCHEMA_VERSION = 7
+
+DATETIME_FORMAT = '%m/%d/%y %H:%M'
+DATE_FORMAT = '%m/%d/%y'
+DATETIME_COLUMNS = ['tpep_pickup_datetime', 'tpep_dropoff_datetime']
+
+CSV_DTYPES = {
+    'VendorID': 'int64',
+    'tpep_pickup_datetime': 'object',
+    'tpep_dropoff_datetime': 'object',
+    'passenger_count': 'int64',
+    'trip_distance': 'float64',
+    'pickup_longitude': 'float64',
+    'pickup_latitude': 'float64',
+    'RatecodeID': 'int64',
+    'dropoff_longitude': 'float64',
+    'dropoff_latitude': 'float64',
+    'payment_type': 'int64',
+    'fare_amount': 'float64',
+    'extra': 'float64',
+    'mta_tax': 'float64',
+    'tip_amount': 'float64',
+    'tolls_amount': 'float64',
+    'total_amount': 'float64',
+    'date': 'object',
+    'DATE': 'object',
+    'PRCP': 'float64',
+    'TMIN': 'int64',
+    'TMAX': 'int64',
+}
+
+# Columns of the merged CSV that are not trip fields: the join keys and the
+# weather repeated on every row.
+MERGED_ONLY_COLUMNS = ['date', 'DATE'] + WEATHER_COLUMNS
+TRIP_DTYPES = {col: dtype for col, dtype in CSV_DTYPES.items() if col not in MERGED_ONLY_COLUMNS}
+
+_METADATA_KEY = b'taxi_ingest'
+
+# Row-group size of the partitioned dataset. The writer buffers up to this many
+# rows per open partition, which keeps row groups (and the footer metadata held
+# for every open file) from degenerating into one tiny group per input batch.
+ROWS_PER_GROUP = 1 << 14
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    Returns the SHA-256 hex digest of a file, read in fixed-size chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _listing_digest(listing):
+    digest = hashlib.sha256()
+    for name in sorted(listing):
+        size, mtime_ns = listing[name]
+        digest.update(f'{name}:{size}:{mtime_ns}\n'.encode())
+    return digest.hexdigest()
+
+
+def _directory_digest(path):
+    """
+    Digest of a partitioned dataset's file listing (relative path, size, mtime),
+    which changes whenever a partition file is added or rewritten.
+    """
+    listing = {}
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            full = os.path.join(root, name)
+            stat = os.stat(full)
+            listing[os.path.relpath(full, path)] = (stat.st_size, stat.st_mtime_ns)
+    return _listing_digest(listing)
+
+
+def partition_files(dataset_dir):
+    """
+    ``{relative path: (size, mtime_ns)}`` of the trip partition files of a
+    dataset directory, skipping the names Arrow's dataset discovery skips
+    (leading ``.`` or ``_``: the weather file and files still being written).
+    """
+    listing = {}
+    for root, dirs, files in os.walk(dataset_dir):
+        dirs[:] = [name for name in dirs if not name.startswith(('.', '_'))]
+        for name in files:
+            if name.endswith('.parquet') and not name.startswith(('.', '_')):
+                full = os.path.join(root, name)
+                stat = os.stat(full)
+                listing[os.path.relpath(full, dataset_dir)] = (stat.st_size, stat.st_mtime_ns)
+    return listing
+
+
+def source_fingerprint(path):
+    """
+    Cheap identity of the source file, compared before falling back to a hash.
+    """
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _arrow_type(dtype):
+    import pyarrow as pa
+
+    return {'int64': pa.int64(), 'float64': pa.float64(), 'object': pa.string()}[dtype]
+
+
+def add_derived_columns(df):
+    """
+    Adds the columns the callbacks filter and group on: ``pickup_hour``,
+    ``pickup_date`` as int32 days since 1970-01-01, the grid cells of the
+    pickup and dropoff (``spatial``) and the trip features and quality flags
+    (``features``).
+    """
+    df['pickup_hour'] = df['tpep_pickup_datetime'].dt.hour
+    df['pickup_date'] = to_day_ordinals(df['tpep_pickup_datetime'])
+    return add_feature_columns(add_cell_columns(df))
+
+
+def parse_trips_csv(csv_path):
+    """
+    Parses the trip fields of the merged CSV with explicit dtypes and a fixed
+    datetime format, then narrows them to the compact schema. Rows come back
+    sorted by pickup_hour so that hour ranges are contiguous.
+    """
+    df = pd.read_csv(csv_path, usecols=list(TRIP_DTYPES), dtype=TRIP_DTYPES)
+    for col in DATETIME_COLUMNS:
+        df[col] = pd.to_datetime(df[col], format=DATETIME_FORMAT)
+    return sort_by_hour(compact_frame(add_derived_columns(df)))
+
+
+def parse_merged_weather(csv_path):
+    """
+    Daily weather of the merged CSV: its weather columns collapsed to one row
+    per ``date``. Only the distinct date strings are parsed.
+    """
+    df = pd.read_csv(csv_path, usecols=['date'] + WEATHER_COLUMNS, dtype=CSV_DTYPES)
+    codes, labels = pd.factorize(df.pop('date'))
+    _, first = np.unique(codes, return_index=True)
+    days = to_day_ordinals(pd.Series(pd.to_datetime(labels, format=DATE_FORMAT)))
+    df = df.iloc[first].reset_index(drop=True)
+    df['pickup_date'] = days.to_numpy()[codes[first]]
+    return WeatherTable.from_frame(compact_frame(df))
+
+
+def _derive_batch(batch):
+    """
+    Arrow-side equivalent of ``add_derived_columns`` for one record batch.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    def column(name):
+        return batch.column(batch.schema.get_field_index(name))
+
+    pickup = column('tpep_pickup_datetime')
+    columns = batch.columns + [pc.hour(pickup), pc.cast(pickup, pa.date32())]
+    names = batch.schema.names + ['pickup_hour', 'pickup_date']
+    for cell_column, (lon_column, lat_column) in CELL_COLUMNS.items():
+        cells = grid_cells(column(lon_column).to_numpy(zero_copy_only=False),
+                           column(lat_column).to_numpy(zero_copy_only=False))
+        columns.append(pa.array(cells))
+        names.append(cell_column)
+    features, flags = trip_features(*(
+        column(name).to_numpy(zero_copy_only=False)
+        for name in ['tpep_pickup_datetime', 'tpep_dropoff_datetime', 'trip_distance', 'fare_amount',
+                     'total_amount', 'tip_amount']))
+    for name, values in features.items():
+        columns.append(pa.array(values))
+        names.append(name)
+    columns.append(pa.array(flags))
+    names.append(FLAGS_COLUMN)
+    return pa.RecordBatch.from_arrays(columns, names=names)
+
+
+class _DayPartitionWriter:
+    """
+    Appends record batches to one Parquet file per pickup day, under hive-style
+    ``pickup_month=YYYY-MM/pickup_day=D`` directories. Rows are buffered per day
+    and written a full row group at a time, so memory is bounded by the number
+    of days open times ``ROWS_PER_GROUP``. Files are written under a hidden
+    name and only ``publish`` renames them into place.
+    """
+
+    def __init__(self, out_dir, basename):
+        self.out_dir = out_dir
+        self.basename = basename
+        self.writers = {}
+        self.pending = {}
+        self.pending_rows = {}
+
+    def write(self, batch):
+        import pyarrow as pa
+
+        days = batch.column(batch.schema.get_field_index('pickup_date')).cast(pa.int32()).to_numpy()
+        order = np.argsort(days, kind='stable')
+        days = days[order]
+        starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        for start, stop in zip(starts, np.r_[starts[1:], len(days)]):
+            day = int(days[start])
+            # take() copies just this day's rows; a slice would keep the whole
+            # input batch alive until the day's row group is flushed.
+            self.pending.setdefault(day, []).append(batch.take(pa.array(order[start:stop])))
+            self.pending_rows[day] = self.pending_rows.get(day, 0) + stop - start
+            if self.pending_rows[day] >= ROWS_PER_GROUP:
+                self._flush(day)
+
+    def _flush(self, day):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_batches(self.pending.pop(day))
+        self.pending_rows.pop(day)
+        writer = self.writers.get(day)
+        if writer is None:
+            date = pd.Timestamp(day, unit='D')
+            directory = os.path.join(self.out_dir, f'pickup_month={date:%Y-%m}', f'pickup_day={date.day}')
+            os.makedirs(directory, exist_ok=True)
+            # Written under a hidden name and renamed by publish(), so readers
+            # (and a watching dashboard) never see a partial partition file.
+            writer = self.writers[day] = pq.ParquetWriter(
+                os.path.join(directory, f'.{self.basename}.parquet.tmp'), table.schema)
+        writer.write_table(table, row_group_size=ROWS_PER_GROUP)
+
+    def close(self):
+        """
+        Writes the buffered rows and completes every file, still hidden.
+        """
+        for day in list(self.pending):
+            self._flush(day)
+        for writer in self.writers.values():
+            writer.close()
+
+    def publish(self):
+        for writer in self.writers.values():
+            directory = os.path.dirname(writer.where)
+            os.replace(writer.where, os.path.join(directory, self.basename + '.parquet'))
+        self.writers = {}
+
+    def abort(self):
+        """
+        Closes and deletes every file written so far, publishing none.
+        """
+        self.pending, self.pending_rows = {}, {}
+        for writer in self.writers.values():
+            try:
+                writer.close()
+            except Exception:
+                # Deleted either way; the error being handled is the one to report.
+                pass
+            if os.path.exists(writer.where):
+                os.remove(writer.where)
+        self.writers = {}
+
+
+def _csv_header(csv_path):
+    with open(csv_path, newline='') as fh:
+        return next(csv.reader(fh), [])
+
+
+def _batch_weather(batch):
+    """
+    The daily weather carried by a merged-CSV batch, one row per pickup day.
+    """
+    import pyarrow as pa
+
+    names = ['pickup_date'] + [col for col in WEATHER_COLUMNS if col in batch.schema.names]
+    columns = [batch.column(batch.schema.get_field_index(name)) for name in names]
+    columns[0] = columns[0].cast(pa.int32())
+    return WeatherTable.from_frame(pa.RecordBatch.from_arrays(columns, names=names).to_pandas())
+
+
+def stream_to_partitions(csv_paths, out_dir, block_size=4 << 20):
+    """
+    Streams trip CSVs into a Parquet dataset partitioned by pickup month and
+    day (``out_dir/pickup_month=2016-01/pickup_day=15/*.parquet``).
+
+    Each file is read in batches of about ``block_size`` bytes with the same
+    explicit schema as ``parse_trips_csv`` (ISO or ``DATETIME_FORMAT``
+    timestamps), the derived columns are computed per batch, and the batch is
+    appended to its day partitions before the next one is read. Only trip
+    fields are written; columns the raw TLC files add (e.g.
+    ``improvement_surcharge``) are skipped, and the weather of merged inputs is
+    collected per day instead. Peak memory depends on ``block_size`` (Arrow
+    keeps a bounded read-ahead of blocks) and on ``ROWS_PER_GROUP`` times the
+    days in one file, not on the size of the input.
+
+    Partition files are renamed into place only once every input has been
+    read; when any input fails, the files written so far are deleted and the
+    error is re-raised, so a failed run publishes no partial data.
+
+    Returns the number of rows written and the ``WeatherTable`` found in the
+    inputs (None when they carry no weather).
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    column_types = {col: _arrow_type(dtype) for col, dtype in CSV_DTYPES.items()}
+    for col in DATETIME_COLUMNS:
+        column_types[col] = pa.timestamp('ns')
+    rows_written = 0
+    weather_days = []
+    writers = []
+    try:
+        for i, csv_path in enumerate(csv_paths):
+            header = _csv_header(csv_path)
+            weather_columns = [col for col in WEATHER_COLUMNS if col in header]
+            convert_options = pacsv.ConvertOptions(
+                column_types=column_types,
+                timestamp_parsers=[pacsv.ISO8601, DATETIME_FORMAT],
+                include_columns=[col for col in TRIP_DTYPES if col in header] + weather_columns,
+            )
+            reader = pacsv.open_csv(csv_path, read_options=pacsv.ReadOptions(block_size=block_size),
+                                    convert_options=convert_options)
+            stem = os.path.splitext(os.path.basename(csv_path))[0]
+            writer = _DayPartitionWriter(out_dir, f'{stem}-{i}')
+            writers.append(writer)
+            for batch in reader:
+                batch = _derive_batch(batch)
+                if weather_columns:
+                    weather_days.append(_batch_weather(batch).to_frame())
+                    keep = [name for name in batch.schema.names if name not in weather_columns]
+                    batch = pa.RecordBatch.from_arrays(
+                        [batch.column(batch.schema.get_field_index(name)) for name in keep], names=keep)
+                writer.write(batch)
+                rows_written += batch.num_rows
+            writer.close()
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        raise
+    for writer in writers:
+        writer.publish()
+    weather = None
+    if weather_days:
+        weather = WeatherTable.from_frame(compact_frame(pd.concat(weather_days, ignore_index=True)))
+    return rows_written, weather
+
+
+def write_weather(weather, path):
+    """
+    Writes a ``WeatherTable`` to Parquet, aside and renamed into place.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    pq.write_table(pa.Table.from_pandas(weather.to_frame(), preserve_index=False), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def read_weather(path):
+    import pyarrow.parquet as pq
+
+    return WeatherTable.from_frame(pq.read_table(path).to_pandas())
+
+
+def build_dataset(csv_paths, out_dir, weather_path=None, block_size=4 << 20):
+    """
+    Pipeline stage producing the dashboard dataset: trip CSVs streamed into
+    ``out_dir`` partitions by ``stream_to_partitions``, and the daily weather
+    dimension written next to them as ``WEATHER_FILENAME``. The weather comes
+    from ``weather_path`` (a NOAA daily file) or else from merged inputs.
+    Returns the number of trip rows written; raises ValueError, before any
+    trip is written, when no weather would be available.
+    """
+    existing_path = os.path.join(out_dir, WEATHER_FILENAME)
+    carries_weather = any(col in _csv_header(path) for path in csv_paths for col in WEATHER_COLUMNS)
+    if not weather_path and not carries_weather and not os.path.exists(existing_path):
+        raise ValueError('the trip files carry no weather; pass a daily weather file')
+    weather = WeatherTable.read_csv(weather_path) if weather_path else None
+    rows, merged_weather = stream_to_partitions(csv_paths, out_dir, block_size=block_size)
+    if weather is None:
+        weather = merged_weather
+    os.makedirs(out_dir, exist_ok=True)
+    if os.path.exists(existing_path):
+        # Appending to an existing dataset: keep the days already recorded.
+        existing = read_weather(existing_path)
+        weather = existing if weather is None else existing.merge(weather)
+    write_weather(weather, existing_path)
+    return rows
+
+
+def load_partitioned_trips(dataset_dir, files=None):
+    """
+    Reads a dataset written by ``build_dataset`` into the same compact frame
+    ``parse_trips_csv`` returns (partition keys and any weather columns of
+    older datasets dropped, sorted by hour). ``files`` (paths relative to
+    ``dataset_dir``) restricts the read to those partition files.
+    """
+    import pyarrow.dataset as pads
+
+    if files is None:
+        dataset = pads.dataset(dataset_dir, format='parquet', partitioning='hive')
+    else:
+        dataset = pads.dataset([os.path.join(dataset_dir, name) for name in sorted(files)], format='parquet',
+                               partitioning='hive', partition_base_dir=dataset_dir)
+    table = dataset.to_table()
+    dropped = ['pickup_month', 'pickup_day'] + MERGED_ONLY_COLUMNS
+    table = table.drop([name for name in dropped if name in table.schema.names])
+    df = table.to_pandas(date_as_object=False)
+    if not set(CELL_COLUMNS) <= set(df.columns):
+        add_cell_columns(df)
+    if not set(FEATURE_COLUMNS + [FLAGS_COLUMN]) <= set(df.columns):
+        # Partitions written before the feature stage.
+        add_feature_columns(df)
+    return sort_by_hour(compact_frame(df))
+
+
+def cache_path_for(csv_path, cache_dir=CACHE_DIR, suffix=''):
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(cache_dir, name + suffix + '.parquet')
+
+
+def _read_cache_metadata(cache_path):
+    import pyarrow.parquet as pq
+
+    try:
+        metadata = pq.read_schema(cache_path).metadata or {}
+    except (OSError, ValueError):
+        return None
+    raw = metadata.get(_METADATA_KEY)
+    return json.loads(raw) if raw else None
+
+
+def _cache_is_fresh(csv_path, cached):
+    if cached is None or cached.get('schema_version') != SCHEMA_VERSION:
+        return False
+    fingerprint = source_fingerprint(csv_path)
+    if fingerprint == cached.get('fingerprint'):
+        return True
+    # Touched or copied but possibly unchanged: settle it by content.
+    return fingerprint['size'] == cached['fingerprint']['size'] and \
+        file_digest(csv_path) == cached.get('sha256')
+
+
+def write_cache(df, cache_path, csv_path):
+    """
+    Writes the parsed table to Parquet with the source identity embedded in the
+    schema metadata. The file is written aside and renamed into place so that a
+    concurrent reader never sees a partial cache.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    info = {
+        'schema_version': SCHEMA_VERSION,
+        'fingerprint': source_fingerprint(csv_path),
+        'sha256': file_digest(csv_path),
+    }
+    metadata = dict(table.schema.metadata or {})
+    metadata[_METADATA_KEY] = json.dumps(info).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, cache_path)
+
+
+def load_trips(csv_path, cache_dir=CACHE_DIR):
+    """
+    Loads the trip table, from the Parquet cache when it matches the source CSV
+    and by parsing the CSV (and refreshing the cache) otherwise. ``csv_path``
+    may also be a directory written by ``build_dataset``.
+    """
+    import pyarrow.parquet as pq
+
+    if os.path.isdir(csv_path):
+        # A partitioned dataset is already typed and columnar.
+        return load_partitioned_trips(csv_path)
+
+    cache_path = cache_path_for(csv_path, cache_dir)
+    if os.path.exists(cache_path) and _cache_is_fresh(csv_path, _read_cache_metadata(cache_path)):
+        return pq.read_table(cache_path).to_pandas()
+
+    df = parse_trips_csv(csv_path)
+    try:
+        write_cache(df, cache_path, csv_path)
+    except OSError:
+        # A read-only deploy still serves; it just parses on every start.
+        pass
+    return df
+
+
+def load_weather(csv_path, cache_dir=CACHE_DIR):
+    """
+    Loads the daily ``WeatherTable`` of a merged CSV (cached like the trip
+    table) or of a dataset directory. A dataset without weather yields an
+    empty table, whose joins read as NaN.
+    """
+    import pyarrow.dataset as pads
+
+    if os.path.isdir(csv_path):
+        weather_path = os.path.join(csv_path, WEATHER_FILENAME)
+        if os.path.exists(weather_path):
+            return read_weather(weather_path)
+        # Datasets written before the weather dimension kept it on the trips.
+        dataset = pads.dataset(csv_path, format='parquet', partitioning='hive')
+        columns = [col for col in WEATHER_COLUMNS if col in dataset.schema.names]
+        if not columns:
+            return WeatherTable.empty()
+        frame = dataset.to_table(columns=['pickup_date'] + columns).to_pandas(date_as_object=False)
+        return WeatherTable.from_frame(compact_frame(frame))
+
+    cache_path = cache_path_for(csv_path, cache_dir, suffix='.weather')
+    if os.path.exists(cache_path) and _cache_is_fresh(csv_path, _read_cache_metadata(cache_path)):
+        return read_weather(cache_path)
+
+    weather = parse_merged_weather(csv_path)
+    try:
+        write_cache(weather.to_frame(), cache_path, csv_path)
+    except OSError:
+        pass
+    return weather
+
+
+def dataset_version(csv_path, cache_dir=CACHE_DIR, files=None):
+    """
+    Identifies the loaded dataset: the source content hash plus the cache
+    schema. Read from the Parquet cache metadata when it is current, so this is
+    cheap right after ``load_trips``. For a dataset directory loaded from a
+    ``partition_files`` listing, pass the listing as ``files``.
+    """
+    if os.path.isdir(csv_path):
+        if files is not None:
+            weather_path = os.path.join(csv_path, WEATHER_FILENAME)
+            listing = dict(files)
+            if os.path.exists(weather_path):
+                stat = os.stat(weather_path)
+                listing[WEATHER_FILENAME] = (stat.st_size, stat.st_mtime_ns)
+            return f'{_listing_digest(listing)[:16]}.s{SCHEMA_VERSION}'
+        return f'{_directory_digest(csv_path)[:16]}.s{SCHEMA_VERSION}'
+    cache_path = cache_path_for(csv_path, cache_dir)
+    cached = _read_cache_metadata(cache_path) if os.path.exists(cache_path) else None
+    if _cache_is_fresh(csv_path, cached):
+        digest = cached['sha256']
+    else:
+        digest = file_digest(csv_path)
+    return f'{digest[:16]}.s{SCHEMA_VERSION}'
+
+
+def appended_version(version, files):
+    """
+    Version of a dataset after the partition ``files`` (a ``partition_files``
+    listing) were appended to the one identified by ``version``. It depends on
+    the whole sequence of appends, so an incrementally refreshed dataset never
+    shares cached figures with a fresh load of the same files.
+    """
+    digest = hashlib.sha256(version.encode())
+    digest.update(_listing_digest(files).encode())
+    return f'{digest.hexdigest()[:16]}.s{SCHEMA_VERSION}'
+
+
+def snapshot_path_for(csv_path, cache_dir=CACHE_DIR):
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(cache_dir, name + '.arrow')
+
+
+def write_snapshot(df, snapshot_path, version):
+    """
+    Writes the trip table as an uncompressed Arrow IPC file, the layout that
+    can be memory-mapped and read without decoding. Written aside and renamed
+    into place like the Parquet cache.
+    """
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_METADATA_KEY] = json.dumps({'version': version}).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    os.makedirs(os.path.dirname(snapshot_path) or '.', exist_ok=True)
+    tmp_path = f'{snapshot_path}.{os.getpid()}.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, snapshot_path)
+
+
+def map_snapshot(snapshot_path, version):
+    """
+    Memory-maps an Arrow snapshot read-only and wraps it in a DataFrame without
+    copying: each numeric and datetime column is a read-only view of the mapped
+    pages, which the kernel shares between every process mapping the file.
+    Returns None when the snapshot is missing or of another version.
+    """
+    import pyarrow as pa
+
+    if not os.path.exists(snapshot_path):
+        return None
+    source = pa.memory_map(snapshot_path, 'r')
+    reader = pa.ipc.open_file(source)
+    cached = (reader.schema.metadata or {}).get(_METADATA_KEY)
+    if not cached or json.loads(cached).get('version') != version:
+        return None
+    # split_blocks keeps one block per column so pandas does not consolidate
+    # (copy) same-typed columns into a private 2-D array.
+    return reader.read_all().to_pandas(split_blocks=True)
+
+
+def load_shared_trips(csv_path, cache_dir=CACHE_DIR):
+    """
+    Loads the trip table from a memory-mapped Arrow snapshot, building the
+    snapshot from the regular ingest path first when it is missing or stale.
+    Run the server with a preloading master (``gunicorn --preload``) to build it
+    once; otherwise the first worker to start builds it and the others map it.
+    """
+    version = dataset_version(csv_path, cache_dir)
+    snapshot_path = snapshot_path_for(csv_path, cache_dir)
+    df = map_snapshot(snapshot_path, version)
+    if df is None:
+        write_snapshot(load_trips(csv_path, cache_dir), snapshot_path, version)
+        df = map_snapshot(snapshot_path, version)
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Stream trip CSVs into a month/day partitioned Parquet dataset with daily weather.')
+    parser.add_argument('csv_paths', nargs='+', help='trip CSV files to ingest')
+    parser.add_argument('--out', required=True, help='output dataset directory')
+    parser.add_argument('--weather', help='NOAA daily weather CSV (optional for merged trip files)')
+    parser.add_argument('--block-size-mb', type=int, default=4,
+                        help='approximate size of each CSV read batch')
+    args = parser.parse_args()
+    try:
+        rows = build_dataset(args.csv_paths, args.out, weather_path=args.weather,
+                             block_size=args.block_size_mb << 20)
+    except ValueError as exc:
+        parser.error(str(exc))
+    print(f'wrote {rows} rows to {args.out}')
@@ -0,0 +1,70 @@
+"""
+Resident-memory figures for the current process or any process by pid.
+
+Reads ``/proc/<pid>/smaps_rollup`` (Linux). RSS counts every mapped page a
+process touches; PSS divides shared pages between the processes mapping them,
+so summing PSS over server workers gives their real combined footprint. With the
+shared-memory dataset the trip columns show up as file-backed shared pages
+instead of private anonymous memory in every worker.
+
+    python memory_report.py <pid> [<pid> ...]
+"""
+import logging
+import os
+import sys
+
+
+logger = logging.getLogger(__name__)
+
+_FIELDS = {
+    'Rss': 'rss',
+    'Pss': 'pss',
+    'Shared_Clean': 'shared_clean',
+    'Shared_Dirty': 'shared_dirty',
+    'Private_Clean': 'private_clean',
+    'Private_Dirty': 'private_dirty',
+    'Anonymous': 'anonymous',
+}
+
+
+def process_memory(pid='self'):
+    """
+    Returns memory counters in bytes for ``pid``, or an empty dict where
+    ``/proc`` is not available.
+    """
+    stats = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as fh:
+            for line in fh:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].rstrip(':') in _FIELDS:
+                    stats[_FIELDS[parts[0].rstrip(':')]] = int(parts[1]) * 1024
+    except OSError:
+        return {}
+    stats['shared'] = stats.get('shared_clean', 0) + stats.get('shared_dirty', 0)
+    stats['private'] = stats.get('private_clean', 0) + stats.get('private_dirty', 0)
+    return stats
+
+
+def format_memory(stats):
+    if not stats:
+        return 'memory statistics unavailable'
+    mib = 1024 * 1024
+    return (f"rss={stats['rss'] / mib:.1f}MiB pss={stats['pss'] / mib:.1f}MiB "
+            f"private={stats['private'] / mib:.1f}MiB shared={stats['shared'] / mib:.1f}MiB "
+            f"anon={stats['anonymous'] / mib:.1f}MiB")
+
+
+def log_memory(label, pid='self'):
+    stats = process_memory(pid)
+    logger.info('pid %s %s: %s', os.getpid() if pid == 'self' else pid, label, format_memory(stats))
+    return stats
+
+
+if __name__ == '__main__':
+    total_pss = 0
+    for arg in sys.argv[1:] or ['self']:
+        stats = process_memory(arg)
+        total_pss += stats.get('pss', 0)
+        print(f'{arg}: {format_memory(stats)}')
+    print(f'total pss: {total_pss / (1024 * 1024):.1f}MiB')
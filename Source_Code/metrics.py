@@ -0,0 +1,207 @@
+"""
+Per-callback instrumentation exported in the Prometheus text format.
+
+``instrument_callback`` times every call of a server-side callback; the size of
+the JSON response Dash sends for it is taken from the finished response, and
+``caching.memoize_callback`` counts store hits and misses. ``init_metrics``
+serves everything at ``/metrics`` on the Flask server behind the Dash app:
+
+- ``taxi_callback_duration_seconds`` (histogram, label ``callback``)
+- ``taxi_callback_payload_bytes`` (histogram, label ``callback``)
+- ``taxi_callback_cache_requests_total`` (counter, labels ``callback``,
+  ``result`` = hit/miss)
+
+Metrics live in the serving process; with several workers each scrape reports
+the worker that answered it. Background callbacks (the Relationship scatter)
+run in short-lived job processes; their duration and the cache lookups they
+made are handed back through the job store and recorded by the worker that
+collects the result (``caching.TimedDiskcacheManager``).
+
+Setting ``TAXI_PROFILE_RATE`` (0-1) profiles that fraction of requests with
+cProfile and writes one ``.prof`` file per sampled request to
+``TAXI_PROFILE_DIR`` (default ``<TAXI_CACHE_DIR>/profiles``); read them with
+``python -m pstats``.
+"""
+import bisect
+import cProfile
+import functools
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+
+import flask
+
+from ingest import CACHE_DIR
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_RATE = float(os.environ.get('TAXI_PROFILE_RATE', '0'))
+PROFILE_DIR = os.environ.get('TAXI_PROFILE_DIR', os.path.join(CACHE_DIR, 'profiles'))
+
+DURATION_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+PAYLOAD_BUCKETS = [256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216]
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_profile_sequence = itertools.count()
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic count per label combination.
+    """
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def snapshot(self):
+        """
+        Copy of the count of every label combination.
+        """
+        with self._lock:
+            return dict(self._values)
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labelvalues, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram per label combination, as Prometheus client
+    libraries expose it (``_bucket``/``_sum``/``_count`` series).
+    """
+
+    def __init__(self, name, documentation, labelnames, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = list(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            counts, total = self._series.get(labelvalues, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._series[labelvalues] = (counts, total + value)
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labelvalues, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ['+Inf'], counts):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, labelvalues, f'le="{_format_value(bound)}"')
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labelnames, labelvalues)
+                lines.append(f'{self.name}_sum{labels} {_format_value(float(total))}')
+                lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+CALLBACK_DURATION = Histogram('taxi_callback_duration_seconds',
+                              'Wall time of a server-side callback, cache lookup included.',
+                              ['callback'], DURATION_BUCKETS)
+CALLBACK_PAYLOAD = Histogram('taxi_callback_payload_bytes',
+                             'Size of the JSON response sent for a callback.',
+                             ['callback'], PAYLOAD_BUCKETS)
+CACHE_REQUESTS = Counter('taxi_callback_cache_requests_total',
+                         'Memoized callback lookups by result (hit/miss).',
+                         ['callback', 'result'])
+METRICS = [CALLBACK_DURATION, CALLBACK_PAYLOAD, CACHE_REQUESTS]
+
+
+def render():
+    """
+    All metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    return '\n'.join(lines) + '\n'
+
+
+def instrument_callback(func):
+    """
+    Decorator recording the duration of every call of a callback. Inside a
+    request it also names the callback, so the response size can be
+    attributed to it once Dash has serialized the output.
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        if flask.has_request_context():
+            flask.g.taxi_callback = name
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            CALLBACK_DURATION.observe(time.perf_counter() - start, name)
+
+    return wrapper
+
+
+def _start_profile():
+    if PROFILE_RATE > 0 and random.random() < PROFILE_RATE:
+        profile = cProfile.Profile()
+        flask.g.taxi_profile = profile
+        profile.enable()
+
+
+def _finish_request(response):
+    profile = flask.g.pop('taxi_profile', None)
+    name = flask.g.get('taxi_callback')
+    if profile is not None:
+        profile.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        label = name or flask.request.path.strip('/').replace('/', '_') or 'index'
+        path = os.path.join(PROFILE_DIR, f'{time.strftime("%Y%m%dT%H%M%S")}-{os.getpid()}-{next(_profile_sequence)}-{label}.prof')
+        profile.dump_stats(path)
+        logger.debug('wrote request profile %s', path)
+    if name is not None and not response.direct_passthrough:
+        CALLBACK_PAYLOAD.observe(len(response.get_data()), name)
+    return response
+
+
+def init_metrics(server):
+    """
+    Serves ``/metrics`` and installs the request hooks (payload size,
+    sampled profiling) on the Flask server.
+    """
+    server.before_request(_start_profile)
+    server.after_request(_finish_request)
+
+    @server.route('/metrics')
+    def metrics_endpoint():
+        return flask.Response(render(), mimetype=None, content_type=CONTENT_TYPE)
+
+    return server
@@ -0,0 +1,371 @@
+"""
+Cross-filter queries over the trip table with an embedded DuckDB engine.
+
+The precomputed rollups answer every chart for a pickup-hour range. Once the
+dashboard filters narrow the trips further (date range, ``payment_type``,
+``VendorID``, ``RatecodeID``, precipitation bucket, valid trips only),
+``TripQuery`` answers the
+same questions in SQL instead: DuckDB scans the loaded trip columns in place
+(no copy of the frame), applies every filter inside the scan and returns only
+the aggregated result, so no filtered intermediate frame is built.
+
+Filters are a plain dict, as kept in the layout's ``filters`` store::
+
+    {'start_date': '2016-01-01', 'end_date': '2016-01-31',
+     'payment_type': [1, 2], 'VendorID': [], 'RatecodeID': [2],
+     'precipitation': ['light', 'heavy'], 'valid_only': True}
+
+Missing keys, None, False and empty lists leave that dimension unfiltered. The
+precipitation buckets are resolved against the small daily weather table into
+a set of pickup days, so they filter trips without a join. ``valid_only``
+keeps the trips whose precomputed ``quality_flags`` (``features``) are all
+clear, one integer comparison per row.
+"""
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aggregates import equal_width_edges, key_start_hours, time_keys
+from features import FLAGS_COLUMN
+from schema import FIXED_POINT_SCALES, column_values, to_day_ordinals
+from spatial import NO_CELL
+from weather import WEATHER_COLUMNS
+
+
+CODE_FILTERS = ['payment_type', 'VendorID', 'RatecodeID']
+
+# Daily precipitation (inches) at which each bucket after 'dry' starts.
+PRECIPITATION_BUCKETS = ['dry', 'light', 'moderate', 'heavy']
+PRECIPITATION_EDGES = [0.01, 0.1, 0.5]
+
+# DuckDB worker threads per connection; 0 lets DuckDB use every core.
+QUERY_THREADS = int(os.environ.get('TAXI_QUERY_THREADS', '0'))
+
+
+def filters_active(filters):
+    """
+    Whether ``filters`` restricts anything beyond the pickup-hour range.
+    """
+    return bool(filters) and any(filters.values())
+
+
+def precipitation_buckets(prcp):
+    """
+    Bucket name of each daily precipitation value; None where it is missing.
+    """
+    prcp = np.asarray(prcp, dtype='float64')
+    index = np.searchsorted(PRECIPITATION_EDGES, prcp, side='right')
+    return [None if np.isnan(p) else PRECIPITATION_BUCKETS[i] for p, i in zip(prcp, index)]
+
+
+class TripQuery:
+    """
+    SQL view over the loaded trip frames and their weather table. A connection
+    is opened per thread (and again after a fork), each registering the same
+    frames, so concurrent callbacks never share one. Several frames of the
+    same dtypes (the segments of ``dataset.HourIndexedTrips``) are read as one
+    ``trips`` view.
+    """
+
+    def __init__(self, frames, weather):
+        self.frames = list(frames)
+        self.df = self.frames[0]
+        self.weather_frame = pd.DataFrame({'pickup_date': weather.days})
+        for col in WEATHER_COLUMNS:
+            if col in weather.frame:
+                self.weather_frame[col] = column_values(weather.frame, col).astype('float64')
+        self._weather_days = weather.days
+        self._weather_buckets = (precipitation_buckets(self.weather_frame['PRCP'])
+                                 if 'PRCP' in self.weather_frame else [None] * len(weather.days))
+        self._local = threading.local()
+
+    def _connection(self):
+        con = getattr(self._local, 'con', None)
+        if con is None or self._local.pid != os.getpid():
+            con = self._open()
+            self._local.con, self._local.pid = con, os.getpid()
+        return con
+
+    def _open(self):
+        import duckdb
+
+        con = duckdb.connect()
+        if QUERY_THREADS:
+            con.execute(f'SET threads = {QUERY_THREADS}')
+        if len(self.frames) == 1:
+            con.register('trips', self.df)
+        else:
+            for i, frame in enumerate(self.frames):
+                con.register(f'trips_{i}', frame)
+            con.execute('CREATE VIEW trips AS ' + ' UNION ALL '.join(
+                f'SELECT * FROM trips_{i}' for i in range(len(self.frames))))
+        con.register('weather', self.weather_frame)
+        return con
+
+    def _fetch(self, sql):
+        return self._connection().execute(sql).fetchall()
+
+    def _column(self, col, weather=True):
+        """
+        ``col`` when it names a column of the registered trip frames (or, with
+        ``weather``, of the weather table); raises ValueError otherwise, so a
+        name from a request is never written into a statement unchecked.
+        """
+        if isinstance(col, str) and (col in self.df.columns or (weather and col in self.weather_frame.columns)):
+            return col
+        raise ValueError(f'unknown column {col!r}')
+
+    def _value(self, col):
+        """
+        SQL expression decoding ``col`` like ``schema.column_values``.
+        """
+        self._column(col)
+        if col not in self.df and col in self.weather_frame:
+            return f'w."{col}"'
+        if col in FIXED_POINT_SCALES and self.df[col].dtype.kind == 'i':
+            return f't."{col}" / {FIXED_POINT_SCALES[col]}.0'
+        return f't."{col}"'
+
+    def _source(self, columns=()):
+        if any(self._column(col) not in self.df and col in self.weather_frame for col in columns):
+            return 'trips t LEFT JOIN weather w ON w.pickup_date = t.pickup_date'
+        return 'trips t'
+
+    def _sum(self, col):
+        """
+        SQL sum of ``col`` and the divisor turning it into the decoded sum:
+        fixed-point columns are summed exactly as integers.
+        """
+        self._column(col, weather=False)
+        if col in FIXED_POINT_SCALES and self.df[col].dtype.kind == 'i':
+            return f'sum(t."{col}")::DOUBLE', FIXED_POINT_SCALES[col]
+        return f'sum(t."{col}")', 1
+
+    def precipitation_days(self, buckets):
+        """
+        Day ordinals whose precipitation falls in one of ``buckets``.
+        """
+        wanted = set(buckets)
+        return [int(day) for day, bucket in zip(self._weather_days, self._weather_buckets) if bucket in wanted]
+
+    def where(self, hour_range, filters):
+        """
+        SQL condition selecting the trips of the inclusive hour range that
+        pass ``filters``. Every value is coerced to an int before it is
+        written into the statement.
+        """
+        filters = filters or {}
+        clauses = [f't.pickup_hour BETWEEN {int(hour_range[0])} AND {int(hour_range[1])}']
+        if filters.get('start_date'):
+            start = int(to_day_ordinals(pd.Series([pd.Timestamp(filters['start_date'])])).iloc[0])
+            clauses.append(f't.pickup_date >= {start}')
+        if filters.get('end_date'):
+            end = int(to_day_ordinals(pd.Series([pd.Timestamp(filters['end_date'])])).iloc[0])
+            clauses.append(f't.pickup_date <= {end}')
+        for col in CODE_FILTERS:
+            if filters.get(col):
+                clauses.append(f't."{col}" IN ({", ".join(str(int(v)) for v in filters[col])})')
+        if filters.get('precipitation'):
+            days = self.precipitation_days(filters['precipitation'])
+            clauses.append(f't.pickup_date IN ({", ".join(map(str, days))})' if days else 'FALSE')
+        if filters.get('valid_only'):
+            clauses.append(f't."{FLAGS_COLUMN}" = 0')
+        return ' AND '.join(clauses)
+
+    def metrics(self, hour_range, filters):
+        """
+        ``(total_trips, avg_fare, avg_distance)`` like
+        ``HourlyRollup.range_metrics``.
+        """
+        fare_sum, fare_scale = self._sum('fare_amount')
+        distance_sum, distance_scale = self._sum('trip_distance')
+        total, fare, fare_count, distance, distance_count = self._fetch(
+            f'SELECT count(*), {fare_sum}, count(t.fare_amount), {distance_sum}, count(t.trip_distance) '
+            f'FROM trips t WHERE {self.where(hour_range, filters)}')[0]
+        avg_fare = fare / fare_scale / fare_count if fare_count else None
+        avg_distance = distance / distance_scale / distance_count if distance_count else None
+        return int(total), avg_fare, avg_distance
+
+    def quantiles(self, col, hour_range, filters, qs):
+        """
+        Exact quantiles ``qs`` of ``col`` over the filtered trips, or None
+        when there are no values.
+        """
+        value = self._value(col)
+        result = self._fetch(
+            f'SELECT quantile_cont({value}, [{", ".join(repr(float(q)) for q in qs)}]) '
+            f'FROM {self._source([col])} WHERE {self.where(hour_range, filters)} AND {value} IS NOT NULL')[0][0]
+        return None if result is None else [float(v) for v in result]
+
+    def histogram_edges(self, col, hour_range, filters, nbins):
+        """
+        ``nbins + 1`` equi-width edges spanning the values of ``col`` over the
+        filtered trips, like ``aggregates.equal_width_edges``; None when empty.
+        """
+        value = self._value(col)
+        lo, hi = self._fetch(f'SELECT min({value}), max({value}) FROM {self._source([col])} '
+                             f'WHERE {self.where(hour_range, filters)}')[0]
+        if lo is None:
+            return None
+        return equal_width_edges(np.array([lo, hi], dtype='float64'), nbins)
+
+    def histogram(self, col, hour_range, filters, edges):
+        """
+        ``(edges, counts)`` of ``col`` over the given equi-width ``edges``,
+        trimmed like ``HistogramRollup.range_histogram``; None when empty.
+        """
+        value = self._value(col)
+        nbins = len(edges) - 1
+        lo, hi = float(edges[0]), float(edges[-1])
+        width = (hi - lo) / nbins
+        rows = self._fetch(
+            f'SELECT least(floor(({value} - {lo!r}) / {width!r}), {nbins - 1})::INTEGER AS bin, count(*) '
+            f'FROM {self._source([col])} WHERE {self.where(hour_range, filters)} '
+            f'AND {value} BETWEEN {lo!r} AND {hi!r} GROUP BY bin')
+        if not rows:
+            return None
+        counts = np.zeros(nbins, dtype='int64')
+        for index, count in rows:
+            counts[index] = count
+        nonzero = np.flatnonzero(counts)
+        first, last = nonzero[0], nonzero[-1]
+        return edges[first:last + 2], counts[first:last + 1]
+
+    def value_counts(self, col, hour_range, filters):
+        """
+        ``(values, counts)`` of a categorical column, most frequent first.
+        """
+        self._column(col, weather=False)
+        rows = self._fetch(
+            f'SELECT t."{col}" AS value, count(*) AS n FROM trips t '
+            f'WHERE {self.where(hour_range, filters)} AND t."{col}" IS NOT NULL '
+            f'GROUP BY value ORDER BY n DESC, value')
+        return (np.array([row[0] for row in rows]), np.array([row[1] for row in rows], dtype='int64'))
+
+    def fit(self, x_col, y_col, hour_range, filters):
+        """
+        OLS fit of ``y_col`` on ``x_col`` in the format of
+        ``RegressionStats.range_fit``; None when it is undefined.
+        """
+        x, y = self._value(x_col), self._value(y_col)
+        n, slope, intercept, r2, x_min, x_max = self._fetch(
+            f'SELECT regr_count({y}, {x}), regr_slope({y}, {x}), regr_intercept({y}, {x}), regr_r2({y}, {x}), '
+            f'min({x}), max({x}) FROM {self._source([x_col, y_col])} WHERE {self.where(hour_range, filters)}')[0]
+        # Constant x: DuckDB yields a NaN slope and no intercept, where
+        # range_fit has no fit.
+        if n < 2 or slope is None or x_min == x_max:
+            return None
+        return {
+            'slope': slope,
+            'intercept': intercept,
+            'r2': r2,
+            'n': int(n),
+            'x_range': (x_min, x_max),
+        }
+
+    def sample(self, columns, hour_range, filters, max_points):
+        """
+        ``(total, arrays)``: the number of filtered trips and up to
+        ``max_points`` of them (a repeatable reservoir sample) as one float
+        array per column.
+        """
+        selected = ', '.join(f'{self._value(col)} AS c{i}' for i, col in enumerate(columns))
+        where = self.where(hour_range, filters)
+        total = self._fetch(f'SELECT count(*) FROM trips t WHERE {where}')[0][0]
+        sql = f'SELECT {selected} FROM {self._source(columns)} WHERE {where}'
+        if total > max_points:
+            sql = f'SELECT * FROM ({sql}) USING SAMPLE reservoir({int(max_points)} ROWS) REPEATABLE (0)'
+        result = self._connection().execute(sql).fetchnumpy()
+        return int(total), [np.asarray(result[f'c{i}'], dtype='float64') for i in range(len(columns))]
+
+    def timeseries(self, level, filters, start_hour=None, end_hour=None):
+        """
+        Per-bucket ``trips`` and mean ``fare_amount`` / ``trip_distance`` of
+        the filtered trips at a ``TimeSeriesPyramid`` level, laid out like
+        ``TimeSeriesPyramid.frame``: whole buckets overlapping
+        ``[start_hour, end_hour]`` when given.
+        """
+        hour = 't.pickup_date::BIGINT * 24 + t.pickup_hour'
+        bucket = {
+            'hour': hour,
+            'day': 't.pickup_date',
+            'week': 't.pickup_date - (t.pickup_date + 3) % 7',
+            'month': "date_diff('month', DATE '1970-01-01', DATE '1970-01-01' + t.pickup_date)",
+        }[level]
+        where = self.where((0, 23), filters)
+        if start_hour is not None:
+            where += f' AND {hour} >= {int(key_start_hours(time_keys([start_hour], level), level)[0])}'
+        if end_hour is not None:
+            where += f' AND {hour} < {int(key_start_hours(time_keys([end_hour], level) + 1, level)[0])}'
+        fare_sum, fare_scale = self._sum('fare_amount')
+        distance_sum, distance_scale = self._sum('trip_distance')
+        result = self._connection().execute(
+            f'SELECT {bucket} AS bucket, count(*) AS trips, {fare_sum} AS fare_sum, '
+            f'count(t.fare_amount) AS fare_count, {distance_sum} AS distance_sum, '
+            f'count(t.trip_distance) AS distance_count FROM trips t WHERE {where} '
+            f'GROUP BY bucket ORDER BY bucket').fetchnumpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fare = np.asarray(result['fare_sum'], dtype='float64') / fare_scale / result['fare_count']
+            distance = np.asarray(result['distance_sum'], dtype='float64') / distance_scale / result['distance_count']
+        starts = key_start_hours(np.asarray(result['bucket'], dtype='int64'), level)
+        return pd.DataFrame({
+            'pickup_time': starts.astype('datetime64[h]').astype('datetime64[ns]'),
+            'fare_amount': fare,
+            'trip_distance': distance,
+            'trips': np.asarray(result['trips'], dtype='int64'),
+        })
+
+    def grid_cells(self, cell_column, hour_range, filters):
+        """
+        ``(cells, trips, fare_sum, avg_fare)`` per occupied grid cell, like
+        ``GridRollup.range_cells``.
+        """
+        self._column(cell_column, weather=False)
+        fare_sum, fare_scale = self._sum('fare_amount')
+        result = self._connection().execute(
+            f'SELECT t."{cell_column}" AS cell, count(*) AS trips, {fare_sum} AS fare_sum, '
+            f'count(t.fare_amount) AS fare_count FROM trips t WHERE {self.where(hour_range, filters)} '
+            f'AND t."{cell_column}" <> {int(NO_CELL)} GROUP BY cell ORDER BY cell').fetchnumpy()
+        fare = np.nan_to_num(np.asarray(result['fare_sum'], dtype='float64')) / fare_scale
+        with np.errstate(invalid='ignore', divide='ignore'):
+            avg_fare = fare / result['fare_count']
+        return (np.asarray(result['cell'], dtype='int64'), np.asarray(result['trips'], dtype='int64'),
+                fare, avg_fare)
+
+    def export_columns(self):
+        """
+        SQL select list of an exported trip row: the trip columns as the CSV
+        held them (timestamps to the second, money and distances with two
+        decimals), the pickup date and the day's weather.
+        """
+        selected = []
+        for col in self.df.columns:
+            if col in ('pickup_cell', 'dropoff_cell'):
+                continue
+            kind = self.df[col].dtype.kind
+            if kind == 'M':
+                selected.append(f't."{col}"::TIMESTAMP::TIMESTAMP_S AS "{col}"')
+            elif col == 'pickup_date':
+                selected.append(f"DATE '1970-01-01' + t.pickup_date AS pickup_date")
+            elif col in FIXED_POINT_SCALES and kind == 'i':
+                digits = len(str(FIXED_POINT_SCALES[col])) - 1
+                selected.append(f't."{col}"::DECIMAL(18, {digits}) / {FIXED_POINT_SCALES[col]} AS "{col}"')
+            else:
+                selected.append(f't."{col}"')
+        for col in WEATHER_COLUMNS:
+            if col in self.weather_frame:
+                selected.append(f'w."{col}"' if col == 'PRCP' else f'w."{col}"::INTEGER AS "{col}"')
+        return selected
+
+    def export_reader(self, hour_range, filters, batch_rows):
+        """
+        Arrow ``RecordBatchReader`` over the filtered trips, ``batch_rows``
+        rows per batch. The query streams: batches are produced as they are
+        read, on a connection of its own so a long download never holds the
+        thread's query connection.
+        """
+        sql = (f'SELECT {", ".join(self.export_columns())} FROM {self._source(WEATHER_COLUMNS)} '
+               f'WHERE {self.where(hour_range, filters)}')
+        return self._open().execute(sql).to_arrow_reader(batch_rows)
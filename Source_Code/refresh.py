@@ -0,0 +1,85 @@
+"""
+Incremental refresh of a partitioned dataset directory.
+
+``PartitionWatcher`` polls a directory written by ``ingest.build_dataset``
+(``TAXI_DATA_PATH`` pointing at a directory, ``TAXI_REFRESH_INTERVAL`` > 0)
+for trip partition files that were not part of the loaded dataset, e.g. after
+
+    python ingest.py yellow_tripdata_2016-07.csv --weather nyc_weather.csv --out data/trips
+
+and hands the listing of the new files to ``apply``, which reads only those
+files and folds them into the loaded dataset. Partition files are written under
+a hidden name and renamed into place, so a file is complete once it is listed.
+
+Only additions are folded in. A partition file that is rewritten or removed
+cannot be subtracted from the aggregates; the watcher logs it once and the
+change is picked up at the next restart.
+
+Every worker runs its own watcher thread, started once its dataset is loaded.
+Like background loading, the thread does not survive a fork, so run workers
+without ``gunicorn --preload`` when refreshing.
+"""
+import logging
+import os
+import threading
+
+from ingest import partition_files
+
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = float(os.environ.get('TAXI_REFRESH_INTERVAL', '0'))
+
+
+class PartitionWatcher:
+    """
+    Tracks the partition files of ``dataset_dir`` already loaded (``known``,
+    a ``partition_files`` listing) and applies new ones as they appear.
+    """
+
+    def __init__(self, dataset_dir, known, apply, interval=REFRESH_INTERVAL):
+        self.dataset_dir = dataset_dir
+        self.known = dict(known)
+        self.apply = apply
+        self.interval = interval
+        self.refreshes = 0
+        self._reported = set()
+        self._failed = None
+        self._stop = threading.Event()
+
+    def poll(self):
+        """
+        Applies the partition files added since the last poll; returns their
+        listing (empty when there were none). A failed ``apply`` is logged
+        and retried when another file is added.
+        """
+        listing = partition_files(self.dataset_dir)
+        new = {name: stat for name, stat in listing.items() if name not in self.known}
+        changed = {name for name, stat in listing.items() if name in self.known and stat != self.known[name]}
+        changed |= set(self.known) - set(listing)
+        for name in sorted(changed - self._reported):
+            logger.warning('partition %s was rewritten or removed; restart to reload it', name)
+        self._reported |= changed
+        if not new or new == self._failed:
+            return {}
+        try:
+            self.apply(new)
+        except Exception:
+            # Retried once the set of new files changes.
+            logger.exception('could not append %d new partition file(s)', len(new))
+            self._failed = new
+            return {}
+        self.known.update(new)
+        self.refreshes += 1
+        return new
+
+    def start(self):
+        threading.Thread(target=self._run, name='partition-watcher', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
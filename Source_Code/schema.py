@@ -0,0 +1,165 @@
+"""
+Compact in-memory representation of the trip table.
+
+``compact_frame`` narrows every column to the smallest dtype that still holds
+its values exactly:
+
+- codes (``VendorID``, ``RatecodeID``, ``payment_type``, ``quality_flags``)
+  and ``passenger_count`` / ``pickup_hour`` become ``uint8``;
+- money, ``trip_distance``, ``PRCP`` and the derived ``features`` become
+  ``int32`` hundredths (cents), but only when every value is an exact multiple
+  of 0.01;
+- ``TMIN`` / ``TMAX`` become ``int16``;
+- ``pickup_date`` becomes ``int32`` days since 1970-01-01;
+- date strings, where present, become ``category``.
+
+Readers go through ``column_values``, which turns fixed-point columns back into
+the float64 values the CSV held (``cents / 100`` is correctly rounded, so it is
+the same double as parsing the decimal text).
+"""
+import datetime
+import logging
+
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+CODE_COLUMNS = ['VendorID', 'RatecodeID', 'payment_type', 'passenger_count', 'pickup_hour', 'quality_flags']
+SMALL_INT_COLUMNS = ['TMIN', 'TMAX']
+CATEGORY_COLUMNS = ['date', 'DATE']
+FIXED_POINT_SCALES = {
+    'trip_distance': 100,
+    'fare_amount': 100,
+    'extra': 100,
+    'mta_tax': 100,
+    'tip_amount': 100,
+    'tolls_amount': 100,
+    'total_amount': 100,
+    'PRCP': 100,
+    'trip_duration': 100,
+    'avg_speed': 100,
+    'tip_pct': 100,
+}
+
+_EPOCH = datetime.date(1970, 1, 1)
+
+
+def _narrow_int(series, dtype):
+    values = series.to_numpy()
+    info = np.iinfo(dtype)
+    if series.isna().any() or values.min() < info.min or values.max() > info.max:
+        return series
+    return series.astype(dtype)
+
+
+def _to_fixed_point(series, scale):
+    values = series.to_numpy(dtype='float64')
+    if not np.isfinite(values).all():
+        return series
+    units = np.round(values * scale)
+    info = np.iinfo('int32')
+    if units.min() < info.min or units.max() > info.max or not np.array_equal(units / scale, values):
+        return series
+    return pd.Series(units.astype('int32'), index=series.index, name=series.name)
+
+
+def to_day_ordinals(series):
+    """
+    ``int32`` days since 1970-01-01 from datetime64 values or ``datetime.date``
+    objects.
+    """
+    if series.dtype == object:
+        series = pd.to_datetime(series)
+    return pd.Series(series.to_numpy().astype('datetime64[D]').astype('int32'),
+                     index=series.index, name=series.name)
+
+
+def days_to_dates(days):
+    """
+    ``datetime.date`` objects for an array of day ordinals (O(days), used for
+    chart axes and exports).
+    """
+    return np.array([_EPOCH + datetime.timedelta(days=int(day)) for day in days], dtype=object)
+
+
+def compact_frame(df):
+    """
+    Narrows the trip table's columns in place (see the module docstring). A
+    column whose values do not fit the compact type losslessly is left alone.
+    """
+    for col in CODE_COLUMNS:
+        if col in df and df[col].dtype.kind in 'iu':
+            df[col] = _narrow_int(df[col], 'uint8')
+    for col in SMALL_INT_COLUMNS:
+        if col in df and df[col].dtype.kind in 'iu':
+            df[col] = _narrow_int(df[col], 'int16')
+    for col, scale in FIXED_POINT_SCALES.items():
+        if col in df and df[col].dtype.kind == 'f':
+            df[col] = _to_fixed_point(df[col], scale)
+    for col in CATEGORY_COLUMNS:
+        if col in df and df[col].dtype == object:
+            df[col] = df[col].astype('category')
+    if 'pickup_date' in df and df['pickup_date'].dtype.kind not in 'iu':
+        df['pickup_date'] = to_day_ordinals(df['pickup_date'])
+    return df
+
+
+def conform_frame(df, like):
+    """
+    ``df`` with the columns of ``like``, in its order and compact dtypes, so
+    that the two frames can be read as one table (e.g. new trips appended to
+    the loaded ones). Raises ValueError when a column is missing or its values
+    do not fit the other frame's dtype losslessly.
+    """
+    conformed = {}
+    for col in like.columns:
+        if col not in df:
+            raise ValueError(f'column {col!r} is missing')
+        target, values = like[col].dtype, df[col]
+        if values.dtype != target:
+            if col in FIXED_POINT_SCALES and target.kind == 'f':
+                values = pd.Series(column_values(df, col), index=df.index, name=col)
+            elif col in FIXED_POINT_SCALES and target.kind == 'i':
+                values = _to_fixed_point(pd.Series(column_values(df, col), index=df.index, name=col),
+                                         FIXED_POINT_SCALES[col])
+            elif target.kind in 'iu' and values.dtype.kind in 'iu':
+                values = _narrow_int(values, target)
+            elif target.kind in 'fM':
+                values = values.astype(target)
+            if values.dtype != target:
+                raise ValueError(f'column {col!r} of dtype {df[col].dtype} does not fit {target}')
+        conformed[col] = values.to_numpy()
+    return pd.DataFrame(conformed)
+
+
+def column_values(df, col, weather=None, rows=None):
+    """
+    The values of a numeric column as the CSV held them: fixed-point columns
+    come back as float64, integer columns stay integral. Columns not stored on
+    the trips (daily weather) are joined from ``weather`` by ``pickup_date``.
+    ``rows`` (positions) restricts the read, so only those rows are decoded.
+    """
+    if col not in df and weather is not None:
+        days = df['pickup_date'].to_numpy()
+        return weather.values(days if rows is None else days[rows], col)
+    values = df[col].to_numpy()
+    if rows is not None:
+        values = values[rows]
+    if col in FIXED_POINT_SCALES and values.dtype.kind == 'i':
+        return values / FIXED_POINT_SCALES[col]
+    return values
+
+
+def log_memory_footprint(df):
+    """
+    Logs the bytes held by every column (deep, i.e. including Python objects)
+    and the per-row total.
+    """
+    usage = df.memory_usage(index=False, deep=True)
+    rows = max(len(df), 1)
+    for col, nbytes in usage.items():
+        logger.info('column %-22s %-14s %12d bytes %7.2f B/row', col, df[col].dtype, nbytes, nbytes / rows)
+    logger.info('trip table: %d rows, %d bytes, %.1f B/row', len(df), usage.sum(), usage.sum() / rows)
+    return usage
@@ -0,0 +1,87 @@
+"""
+One loaded version of the dashboard dataset.
+
+A ``DatasetSnapshot`` bundles everything the callbacks read: the hour-indexed
+trip rows, the daily weather, every precomputed aggregate, the query layer over
+them and the version their memoized outputs are keyed by. A snapshot is never
+modified. ``append`` folds a batch of new trips into a new snapshot: every
+aggregate is computed over the new rows only and merged into the existing one,
+so the cost of a refresh depends on the size of the batch, not of the history.
+The app publishes a snapshot by replacing one reference, and a callback reads
+that reference once, so it never mixes two versions.
+"""
+from aggregates import (
+    CategoryRollup, GridRollup, HistogramRollup, HourlyRollup, QuantileRollup, RegressionStats, TimeSeriesPyramid,
+)
+from query import TripQuery
+
+
+class DatasetSnapshot:
+    """
+    The trip table, weather and aggregates of one dataset version.
+    """
+
+    def __init__(self, version, trips, weather, columns, hourly_rollup, histogram_rollup, category_rollup,
+                 regression_stats, quantile_rollup, timeseries_pyramid, grid_rollups):
+        self.version = version
+        self.trips = trips
+        self.weather = weather
+        self.columns = columns
+        self.hourly_rollup = hourly_rollup
+        self.histogram_rollup = histogram_rollup
+        self.category_rollup = category_rollup
+        self.regression_stats = regression_stats
+        self.quantile_rollup = quantile_rollup
+        self.timeseries_pyramid = timeseries_pyramid
+        self.grid_rollups = grid_rollups
+        # Cross-filtered queries (date, codes, precipitation) run in DuckDB over
+        # the same in-memory columns.
+        self.trip_query = TripQuery(trips.frames, weather)
+
+    @classmethod
+    def build(cls, version, trips, weather, categorical_columns, numerical_columns, nbins):
+        """
+        Builds every aggregate over the loaded ``HourIndexedTrips``.
+        """
+        frame = trips.df
+        columns = (categorical_columns, numerical_columns)
+        return cls(
+            version, trips, weather, columns,
+            # Per-hour aggregates, so hour-slider callbacks sum at most 24
+            # small arrays instead of filtering every trip.
+            HourlyRollup.from_frame(frame),
+            HistogramRollup.from_frame(frame, numerical_columns, nbins=nbins, weather=weather),
+            CategoryRollup.from_frame(frame, categorical_columns),
+            RegressionStats.from_frame(frame, numerical_columns, weather=weather),
+            QuantileRollup.from_frame(frame, numerical_columns, weather=weather),
+            # Per-hour, day, week and month totals behind the time-series chart,
+            # which reads the level matching its zoom window.
+            TimeSeriesPyramid.from_frame(frame),
+            # Per-cell, per-hour trip counts and fare sums over the spatial grid
+            # assigned at ingest; the density map of an hour range costs
+            # O(cells), not O(trips).
+            {
+                'pickup': GridRollup.from_frame(frame, 'pickup_cell'),
+                'dropoff': GridRollup.from_frame(frame, 'dropoff_cell'),
+            },
+        )
+
+    def append(self, version, new_trips, weather):
+        """
+        Snapshot ``version``: this one plus the trips of ``new_trips``, with
+        ``weather`` (which should cover their days) as its weather table.
+        Raises ValueError when the new trips do not fit the loaded table's
+        columns.
+        """
+        categorical_columns, numerical_columns = self.columns
+        return DatasetSnapshot(
+            version, self.trips.append(new_trips), weather, self.columns,
+            self.hourly_rollup.merge(HourlyRollup.from_frame(new_trips)),
+            self.histogram_rollup.append(new_trips, numerical_columns, weather=weather),
+            self.category_rollup.merge(CategoryRollup.from_frame(new_trips, categorical_columns)),
+            self.regression_stats.merge(RegressionStats.from_frame(new_trips, numerical_columns, weather=weather)),
+            self.quantile_rollup.merge(QuantileRollup.from_frame(new_trips, numerical_columns, weather=weather)),
+            self.timeseries_pyramid.merge(TimeSeriesPyramid.from_frame(new_trips)),
+            {location: rollup.merge(GridRollup.from_frame(new_trips, f'{location}_cell'))
+             for location, rollup in self.grid_rollups.items()},
+        )
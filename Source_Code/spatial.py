@@ -0,0 +1,62 @@
+"""
+Spatial index of trips: a fixed longitude/latitude grid over New York City.
+
+Every pickup and dropoff is assigned at ingest to the grid cell containing it
+(``pickup_cell`` / ``dropoff_cell``, row-major cell ids). Coordinates outside
+the grid, including the 0/0 placeholders of trips without a GPS fix, get
+``NO_CELL``. Cells are about 420 x 555 m, fine enough for a city-wide density
+map and few enough (~10k) that per-cell aggregates stay small.
+"""
+import numpy as np
+
+
+# West, south, east, north edges of the grid in degrees.
+GRID_BOUNDS = (-74.27, 40.49, -73.68, 40.92)
+CELL_DEGREES = 0.005
+
+GRID_COLUMNS = int(np.ceil(round((GRID_BOUNDS[2] - GRID_BOUNDS[0]) / CELL_DEGREES, 9)))
+GRID_ROWS = int(np.ceil(round((GRID_BOUNDS[3] - GRID_BOUNDS[1]) / CELL_DEGREES, 9)))
+CELL_COUNT = GRID_COLUMNS * GRID_ROWS
+
+CELL_DTYPE = 'uint16'
+NO_CELL = np.iinfo(CELL_DTYPE).max
+assert CELL_COUNT < NO_CELL
+
+CELL_COLUMNS = {
+    'pickup_cell': ('pickup_longitude', 'pickup_latitude'),
+    'dropoff_cell': ('dropoff_longitude', 'dropoff_latitude'),
+}
+
+
+def grid_cells(longitude, latitude):
+    """
+    Cell id of every coordinate pair, ``NO_CELL`` outside the grid.
+    """
+    longitude = np.asarray(longitude, dtype='float64')
+    latitude = np.asarray(latitude, dtype='float64')
+    with np.errstate(invalid='ignore'):
+        column = np.floor((longitude - GRID_BOUNDS[0]) / CELL_DEGREES)
+        row = np.floor((latitude - GRID_BOUNDS[1]) / CELL_DEGREES)
+        inside = (column >= 0) & (column < GRID_COLUMNS) & (row >= 0) & (row < GRID_ROWS)
+    cells = np.full(len(longitude), NO_CELL, dtype=CELL_DTYPE)
+    cells[inside] = (row[inside] * GRID_COLUMNS + column[inside]).astype(CELL_DTYPE)
+    return cells
+
+
+def cell_centers(cells):
+    """
+    ``(longitude, latitude)`` of the centers of the given cells.
+    """
+    cells = np.asarray(cells, dtype='int64')
+    row, column = np.divmod(cells, GRID_COLUMNS)
+    return (GRID_BOUNDS[0] + (column + 0.5) * CELL_DEGREES,
+            GRID_BOUNDS[1] + (row + 0.5) * CELL_DEGREES)
+
+
+def add_cell_columns(df):
+    """
+    Adds ``pickup_cell`` and ``dropoff_cell`` to a trip frame.
+    """
+    for cell_column, (lon_column, lat_column) in CELL_COLUMNS.items():
+        df[cell_column] = grid_cells(df[lon_column].to_numpy(), df[lat_column].to_numpy())
+    return df
@@ -0,0 +1,177 @@
+"""
+Deferred dataset loading, readiness and time-to-first-byte reporting.
+
+``DatasetLoader`` runs the dashboard's dataset load (trip table, weather and
+every precomputed aggregate) either inline or, in the background startup mode,
+in a daemon thread, so the server answers with the layout while the data is
+still loading. Data callbacks wrapped in ``requires_dataset`` wait for the load
+to finish. ``init_startup`` serves ``/ready`` for load balancers and
+orchestrators:
+
+- 503 ``{"status": "loading"}`` while the dataset loads,
+- 200 ``{"status": "ready", ...}`` once callbacks can be answered,
+- 500 ``{"status": "failed", ...}`` if the load raised.
+
+Startup timings are measured from process start (``/proc/self/stat``, the
+module import time elsewhere) and logged: when the app module finished
+importing, when the dataset was ready and when the first response was sent
+(time to first byte). They are also part of the ``/ready`` body.
+
+Background loading starts a thread at import, which does not survive a fork:
+under ``gunicorn --preload`` load eagerly (the default) so workers inherit the
+loaded data.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+
+import flask
+from dash.exceptions import PreventUpdate
+
+
+logger = logging.getLogger(__name__)
+
+READY_TIMEOUT = float(os.environ.get('TAXI_READY_TIMEOUT', '60'))
+
+
+def process_start_time():
+    """
+    Wall-clock start of this process, from ``/proc`` where available and the
+    current time otherwise.
+    """
+    try:
+        with open('/proc/self/stat') as fh:
+            # The command name in field 2 may contain spaces; fields after it
+            # are space separated and starttime is the 22nd overall.
+            start_ticks = int(fh.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as fh:
+            uptime = float(fh.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return time.time()
+    return time.time() - (uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+
+
+PROCESS_START = process_start_time()
+
+
+def since_start():
+    return time.time() - PROCESS_START
+
+
+class DatasetLoader:
+    """
+    Runs ``load`` once, inline or in a background thread, and records whether
+    and when it finished.
+    """
+
+    def __init__(self, load):
+        self._load = load
+        self.ready = threading.Event()
+        self.error = None
+        self.timings = {}
+        self._first_byte_lock = threading.Lock()
+
+    def start(self, background=False):
+        if background:
+            threading.Thread(target=self._run, name='dataset-loader', daemon=True).start()
+        else:
+            self._run()
+        return self
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            self._load()
+        except Exception as exc:
+            self.error = exc
+            logger.exception('dataset load failed')
+        else:
+            self.timings['load_seconds'] = time.perf_counter() - start
+            self.timings['ready_after_start_seconds'] = since_start()
+            logger.info('dataset ready after %.2fs (loaded in %.2fs)',
+                        self.timings['ready_after_start_seconds'], self.timings['load_seconds'])
+        finally:
+            self.ready.set()
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the load finished; returns False on timeout and raises if
+        the load failed.
+        """
+        if not self.ready.wait(timeout):
+            return False
+        if self.error is not None:
+            raise RuntimeError('the dataset failed to load') from self.error
+        return True
+
+    def status(self):
+        if not self.ready.is_set():
+            return 'loading'
+        return 'failed' if self.error is not None else 'ready'
+
+    def requires_dataset(self, func):
+        """
+        Decorator making a callback wait (up to ``TAXI_READY_TIMEOUT`` seconds)
+        for the dataset; on timeout the outputs are left unchanged.
+        """
+        @functools.wraps(func)
+        def wrapper(*args):
+            if not self.wait(READY_TIMEOUT):
+                raise PreventUpdate
+            return func(*args)
+
+        return wrapper
+
+    def mark(self, name):
+        self.timings[f'{name}_after_start_seconds'] = since_start()
+        logger.info('%s after %.2fs', name.replace('_', ' '), self.timings[f'{name}_after_start_seconds'])
+
+    def _record_first_byte(self, response):
+        if 'first_byte_after_start_seconds' not in self.timings:
+            with self._first_byte_lock:
+                if 'first_byte_after_start_seconds' not in self.timings:
+                    self.timings['first_byte_after_start_seconds'] = since_start()
+                    logger.info('time to first byte: %.2fs after process start (%s %s, dataset %s)',
+                                self.timings['first_byte_after_start_seconds'], flask.request.method,
+                                flask.request.path, self.status())
+        return response
+
+
+def init_startup(server, loader):
+    """
+    Serves ``/ready`` and records the first response sent by the server.
+    """
+    server.after_request(loader._record_first_byte)
+
+    @server.route('/ready')
+    def ready_endpoint():
+        status = loader.status()
+        body = {'status': status, 'timings': loader.timings}
+        if status == 'failed':
+            body['error'] = repr(loader.error)
+        code = {'loading': 503, 'ready': 200, 'failed': 500}[status]
+        return flask.Response(json.dumps(body), status=code, mimetype='application/json')
+
+    return server
+
+
+def probe_first_byte(url, timeout=60):
+    """
+    Requests ``url`` until the server answers, so time to first byte is
+    measured and logged at startup rather than on the first real visitor.
+    Meant to run in a daemon thread next to the development server.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                response.read(1)
+            return True
+        except OSError:
+            time.sleep(0.05)
+    logger.warning('no response from %s within %ss', url, timeout)
+    return False
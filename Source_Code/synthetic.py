@@ -0,0 +1,212 @@
+"""
+Synthetic trip + weather rows in the ``merged_data.csv`` schema.
+
+Rows are drawn from distributions shaped after the 2016 TLC data: a diurnal
+pickup-hour profile with quieter weekends, log-normal trip distances, fares
+from the metered rate (flat JFK fares for RatecodeID 2), tips on card payments
+only, and one weather record (PRCP/TMIN/TMAX) per calendar day shared by all of
+that day's trips. Money and distances are whole cents, as in the real files.
+
+Output is produced in fixed-size chunks, so any row count can be written with
+bounded memory:
+
+    python synthetic.py 10M --out data/synthetic-10M.csv
+"""
+import argparse
+import datetime
+
+import numpy as np
+import pandas as pd
+
+
+COLUMNS = [
+    'VendorID', 'tpep_pickup_datetime', 'tpep_dropoff_datetime', 'passenger_count',
+    'trip_distance', 'pickup_longitude', 'pickup_latitude', 'RatecodeID',
+    'dropoff_longitude', 'dropoff_latitude', 'payment_type', 'fare_amount', 'extra',
+    'mta_tax', 'tip_amount', 'tolls_amount', 'total_amount', 'date', 'DATE', 'PRCP',
+    'TMIN', 'TMAX',
+]
+
+CHUNK_ROWS = 1_000_000
+
+# Share of a day's pickups starting in each hour (weekday profile).
+HOUR_WEIGHTS = np.array([
+    2.9, 2.1, 1.5, 1.1, 0.9, 0.9, 2.0, 3.6, 4.4, 4.4, 4.2, 4.3,
+    4.6, 4.6, 4.9, 4.8, 4.4, 5.3, 6.3, 6.4, 5.9, 5.7, 5.5, 4.3,
+])
+WEEKEND_DAY_WEIGHT = 0.85
+
+VENDORS = ([1, 2], [0.47, 0.53])
+PASSENGERS = ([1, 2, 3, 4, 5, 6], [0.71, 0.14, 0.04, 0.02, 0.05, 0.04])
+RATECODES = ([1, 2, 5], [0.972, 0.02, 0.008])
+PAYMENT_TYPES = ([1, 2, 3, 4], [0.66, 0.33, 0.006, 0.004])
+
+JFK_FLAT_FARE_CENTS = 5200
+TOLL_CENTS = 554
+MIN_DISTANCE, MAX_DISTANCE = 0.1, 60.0
+MILES_PER_DEGREE_LAT, MILES_PER_DEGREE_LON = 69.0, 52.4
+
+
+def parse_count(text):
+    """
+    Row counts with an optional k/M suffix: ``10k``, ``2.5M``, ``100000``.
+    """
+    text = str(text).strip()
+    multiplier = {'k': 10 ** 3, 'K': 10 ** 3, 'm': 10 ** 6, 'M': 10 ** 6}.get(text[-1:], 1)
+    if multiplier != 1:
+        text = text[:-1]
+    return int(float(text) * multiplier)
+
+
+def daily_weather(dates, rng):
+    """
+    One weather record per day: a seasonal temperature curve with day-to-day
+    noise, and precipitation on roughly a third of the days.
+    """
+    day_of_year = np.array([d.timetuple().tm_yday for d in dates])
+    seasonal = 55 - 22 * np.cos(2 * np.pi * (day_of_year - 20) / 365.25)
+    tmax = np.round(seasonal + 8 + rng.normal(0, 7, len(dates))).astype('int64')
+    tmin = tmax - np.round(rng.uniform(6, 20, len(dates))).astype('int64')
+    wet = rng.random(len(dates)) < 0.33
+    prcp = np.where(wet, np.round(rng.exponential(0.3, len(dates)), 2), 0.0)
+    return pd.DataFrame({'PRCP': prcp, 'TMIN': tmin, 'TMAX': tmax}, index=pd.Index(dates))
+
+
+def _choice(rng, options, rows):
+    values, weights = options
+    return rng.choice(values, size=rows, p=weights)
+
+
+def _format_datetimes(stamps, date_only=False):
+    # The TLC export writes unpadded month/day/hour: 1/5/16 7:04. Trips share
+    # few distinct minutes, so only the unique stamps are formatted.
+    unique, inverse = np.unique(stamps, return_inverse=True)
+    unique = pd.Series(unique.astype('datetime64[ns]')).dt
+    text = (unique.month.astype(str) + '/' + unique.day.astype(str) + '/'
+            + (unique.year % 100).astype(str).str.zfill(2))
+    if not date_only:
+        text = text + ' ' + unique.hour.astype(str) + ':' + unique.minute.astype(str).str.zfill(2)
+    return text.to_numpy()[inverse]
+
+
+def _day_weights(dates):
+    return np.array([WEEKEND_DAY_WEIGHT if d.weekday() >= 5 else 1.0 for d in dates])
+
+
+def generate_chunk(rows, rng, dates, weather):
+    """
+    ``rows`` trips spread over ``dates`` (one ``weather`` row per date).
+    """
+    day_weights = _day_weights(dates)
+    day = rng.choice(len(dates), size=rows, p=day_weights / day_weights.sum())
+    hour = rng.choice(24, size=rows, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    start = np.array(dates, dtype='datetime64[D]')[day].astype('datetime64[m]')
+    pickup = start + (hour * 60 + rng.integers(0, 60, rows)).astype('timedelta64[m]')
+
+    distance_cents = np.round(
+        np.clip(rng.lognormal(0.75, 0.8, rows), MIN_DISTANCE, MAX_DISTANCE) * 100).astype('int64')
+    distance = distance_cents / 100
+    rush = ((hour >= 8) & (hour <= 19)).astype('float64')
+    speed = np.clip(rng.normal(13 - 3 * rush, 3, rows), 4, 40)
+    minutes = np.maximum(np.round(distance / speed * 60 + rng.exponential(2, rows)), 1).astype('int64')
+    dropoff = pickup + minutes.astype('timedelta64[m]')
+
+    ratecode = _choice(rng, RATECODES, rows)
+    payment = _choice(rng, PAYMENT_TYPES, rows)
+    metered = 250 + 250 * distance + 25 * np.maximum(minutes - distance / 12 * 60, 0)
+    fare_cents = np.round(metered / 50).astype('int64') * 50
+    fare_cents = np.where(ratecode == 2, JFK_FLAT_FARE_CENTS, fare_cents)
+    fare_cents = np.where(ratecode == 5, fare_cents * 2, fare_cents)
+    weekday = np.array([d.weekday() < 5 for d in dates])[day]
+    extra_cents = np.where((hour >= 20) | (hour < 6), 50,
+                           np.where(weekday & (hour >= 16), 100, 0))
+    extra_cents = np.where(ratecode == 2, 0, extra_cents)
+    mta_cents = np.full(rows, 50)
+    tip_rate = np.clip(rng.normal(0.2, 0.06, rows), 0, 0.5)
+    tip_cents = np.where(payment == 1, np.round(fare_cents * tip_rate), 0).astype('int64')
+    toll_cents = np.where(rng.random(rows) < np.where(ratecode == 2, 0.5, 0.04), TOLL_CENTS, 0)
+    total_cents = fare_cents + extra_cents + mta_cents + tip_cents + toll_cents + 30
+
+    pickup_lon = np.round(rng.normal(-73.98, 0.025, rows), 8)
+    pickup_lat = np.round(rng.normal(40.75, 0.025, rows), 8)
+    heading = rng.uniform(0, 2 * np.pi, rows)
+    straight_line = distance / 1.3
+    dropoff_lon = np.round(pickup_lon + straight_line * np.cos(heading) / MILES_PER_DEGREE_LON, 8)
+    dropoff_lat = np.round(pickup_lat + straight_line * np.sin(heading) / MILES_PER_DEGREE_LAT, 8)
+
+    day_weather = weather.iloc[day]
+    date_text = _format_datetimes(pickup.astype('datetime64[D]'), date_only=True)
+    return pd.DataFrame({
+        'VendorID': _choice(rng, VENDORS, rows),
+        'tpep_pickup_datetime': _format_datetimes(pickup),
+        'tpep_dropoff_datetime': _format_datetimes(dropoff),
+        'passenger_count': _choice(rng, PASSENGERS, rows),
+        'trip_distance': distance,
+        'pickup_longitude': pickup_lon,
+        'pickup_latitude': pickup_lat,
+        'RatecodeID': ratecode,
+        'dropoff_longitude': dropoff_lon,
+        'dropoff_latitude': dropoff_lat,
+        'payment_type': payment,
+        'fare_amount': fare_cents / 100,
+        'extra': extra_cents / 100,
+        'mta_tax': mta_cents / 100,
+        'tip_amount': tip_cents / 100,
+        'tolls_amount': toll_cents / 100,
+        'total_amount': total_cents / 100,
+        'date': date_text,
+        'DATE': date_text + ' 0:00',
+        'PRCP': day_weather['PRCP'].to_numpy(),
+        'TMIN': day_weather['TMIN'].to_numpy(),
+        'TMAX': day_weather['TMAX'].to_numpy(),
+    }, columns=COLUMNS)
+
+
+def iter_chunks(rows, seed=0, start='2016-01-01', days=91, chunk_rows=CHUNK_ROWS):
+    """
+    Yields DataFrames of at most ``chunk_rows`` rows, ``rows`` in total,
+    reproducibly for a given ``seed``.
+    """
+    rng = np.random.default_rng(seed)
+    first = datetime.date.fromisoformat(start)
+    dates = [first + datetime.timedelta(days=i) for i in range(days)]
+    weather = daily_weather(dates, rng)
+    remaining = rows
+    while remaining > 0:
+        size = min(chunk_rows, remaining)
+        yield generate_chunk(size, rng, dates, weather)
+        remaining -= size
+
+
+def generate_trips(rows, **kwargs):
+    """
+    ``rows`` synthetic trips as one DataFrame of CSV-level values.
+    """
+    chunks = list(iter_chunks(rows, **kwargs))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=COLUMNS)
+
+
+def write_csv(path, rows, **kwargs):
+    """
+    Streams ``rows`` synthetic trips to ``path`` chunk by chunk.
+    """
+    with open(path, 'w', newline='') as fh:
+        header = True
+        for chunk in iter_chunks(rows, **kwargs):
+            chunk.to_csv(fh, index=False, header=header)
+            header = False
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic rows in the merged_data.csv schema.')
+    parser.add_argument('rows', help='number of rows, e.g. 10k, 1M, 100M')
+    parser.add_argument('--out', required=True, help='CSV file to write')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start', default='2016-01-01', help='first pickup date (YYYY-MM-DD)')
+    parser.add_argument('--days', type=int, default=91, help='number of pickup dates')
+    parser.add_argument('--chunk-rows', type=parse_count, default=CHUNK_ROWS)
+    args = parser.parse_args()
+    rows = parse_count(args.rows)
+    write_csv(args.out, rows, seed=args.seed, start=args.start, days=args.days, chunk_rows=args.chunk_rows)
+    print(f'wrote {rows} rows to {args.out}')
@@ -0,0 +1,115 @@
+"""
+Daily weather as a dimension table of the trip data.
+
+Weather is recorded once per calendar day, so instead of repeating PRCP/TMIN/
+TMAX on every trip row it is kept in a ``WeatherTable`` keyed by day ordinal
+(the encoding of the trips' ``pickup_date``) and joined onto trips only when a
+column is read: ``WeatherTable.values`` maps each trip's pickup date to its
+day's value with one vectorized gather.
+
+The table comes from a NOAA daily file (``read_csv``; ``DATE``, ``PRCP``,
+``TMIN``, ``TMAX`` columns) or, for the pre-joined ``merged_data.csv``, from
+the weather columns already on the trip rows (``from_frame``).
+"""
+import numpy as np
+import pandas as pd
+
+from schema import column_values, compact_frame, to_day_ordinals
+
+
+WEATHER_COLUMNS = ['PRCP', 'TMIN', 'TMAX']
+
+# Weather file of a partitioned dataset; the leading underscore keeps Arrow's
+# dataset discovery from taking it for a trip partition.
+WEATHER_FILENAME = '_weather.parquet'
+
+
+class WeatherTable:
+    """
+    One row of weather per day, ``days`` sorted ascending (int32 days since
+    1970-01-01) and ``frame`` holding the compact weather columns in the same
+    order.
+    """
+
+    def __init__(self, days, frame):
+        self.days = np.asarray(days, dtype='int32')
+        self.frame = frame.reset_index(drop=True)
+        # Dense day -> row lookup over the covered span, so a join is a single
+        # array gather rather than a search per trip.
+        if len(self.days):
+            self._slot = np.full(int(self.days[-1]) - int(self.days[0]) + 1, -1, dtype='int64')
+            self._slot[self.days - self.days[0]] = np.arange(len(self.days))
+        else:
+            self._slot = np.empty(0, dtype='int64')
+
+    @classmethod
+    def from_frame(cls, df, day_column='pickup_date'):
+        """
+        Collapses rows that carry the weather of their day (e.g. merged trip
+        rows) to one row per day; ``day_column`` holds day ordinals.
+        """
+        columns = [col for col in WEATHER_COLUMNS if col in df]
+        days = df[day_column].to_numpy()
+        unique_days, first = np.unique(days, return_index=True)
+        frame = pd.DataFrame({col: df[col].to_numpy()[first] for col in columns})
+        return cls(unique_days, frame)
+
+    @classmethod
+    def read_csv(cls, path):
+        """
+        Reads a NOAA daily summary (one row per ``DATE``).
+        """
+        df = pd.read_csv(path, usecols=lambda col: col == 'DATE' or col in WEATHER_COLUMNS)
+        df['pickup_date'] = to_day_ordinals(pd.to_datetime(df.pop('DATE')))
+        return cls.from_frame(compact_frame(df))
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype='int32'), pd.DataFrame(columns=WEATHER_COLUMNS))
+
+    def __len__(self):
+        return len(self.days)
+
+    def merge(self, newer):
+        """
+        Table of the days of both tables; where both have a day, ``newer``
+        wins.
+        """
+        columns = [col for col in WEATHER_COLUMNS if col in self.frame or col in newer.frame]
+        parts = []
+        for table in (newer, self):
+            part = pd.DataFrame({'pickup_date': table.days})
+            for col in columns:
+                part[col] = table.values(table.days, col)
+            parts.append(part)
+        # from_frame keeps the first row of each day, i.e. the newer one.
+        return WeatherTable.from_frame(compact_frame(pd.concat(parts, ignore_index=True)))
+
+    def to_frame(self):
+        """
+        The table as a flat frame (``pickup_date`` plus the weather columns),
+        the layout written to Parquet.
+        """
+        frame = self.frame.copy()
+        frame.insert(0, 'pickup_date', self.days)
+        return frame
+
+    def values(self, days, col):
+        """
+        ``col`` for each entry of ``days`` (trip pickup dates), decoded like
+        ``schema.column_values``. Days without a weather record read as NaN.
+        """
+        days = np.asarray(days, dtype='int64')
+        if col not in self.frame or not len(self.days):
+            return np.full(len(days), np.nan)
+        offset = days - int(self.days[0])
+        inside = (offset >= 0) & (offset < len(self._slot))
+        slot = np.where(inside, self._slot[np.clip(offset, 0, len(self._slot) - 1)], -1)
+        found = slot >= 0
+        stored = column_values(self.frame, col)
+        if found.all():
+            return stored[slot]
+        joined = stored.astype('float64')[np.maximum(slot, 0)]
+        joined[~found] = np.nan
+        return joined
+